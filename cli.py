@@ -0,0 +1,154 @@
+"""
+Convert bank statement PDFs in bulk, without the Streamlit app.
+
+    python cli.py statements/ --bank Galicia --output out/
+    python cli.py "2024/**/*.pdf" --workers 8 --format parquet
+"""
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+from lib import diagnostics
+from lib.export import Source, export_formats, export_name
+from lib.parsers.base import BankParser, CERTAIN_CONFIDENCE
+from lib.timing import Timings
+
+def find_pdfs(inputs: List[str]) -> List[str]:
+    """
+    Expand files, directories and glob patterns into a sorted list of PDFs
+    """
+    paths = []
+    for entry in inputs:
+        if os.path.isdir(entry):
+            paths.extend(
+                os.path.join(entry, name) for name in os.listdir(entry)
+                if name.lower().endswith('.pdf')
+            )
+        elif os.path.isfile(entry):
+            paths.append(entry)
+        else:
+            paths.extend(path for path in glob.glob(entry, recursive=True) if path.lower().endswith('.pdf'))
+    return sorted(dict.fromkeys(paths))
+
+def output_stems(paths: List[str], output: str) -> Dict[str, str]:
+    """
+    Output path, without extension, of every input.
+
+    Inputs keep their directories below the deepest directory they share,
+    so statements with the same name in different folders never collide.
+    """
+    base = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+    return {
+        path: os.path.join(output, os.path.splitext(os.path.relpath(os.path.abspath(path), base))[0])
+        for path in paths
+    }
+
+def _init_worker(verbose: bool) -> None:
+    # Files are already spread across processes; extracting a file's pages
+    # in a nested pool would only oversubscribe the CPUs
+    from lib.api import file
+    file.MAX_WORKERS = 1
+    logging.basicConfig(level=logging.DEBUG if verbose else logging.WARNING)
+
+def convert_file(path: str, bank: Optional[str], output_stem: str, use_cache: bool, format_name: str = "xlsx") -> Dict:
+    """
+    Convert one PDF and write its export in the given format; runs in a worker
+    """
+    from lib.api.file import first_page_text
+    from lib.converter import convert
+
+    started = time.perf_counter()
+    timings = Timings()
+    summary = {"path": path, "bank": bank, "pages": 0, "accounts": 0, "rows": 0, "outputs": [], "error": None}
+    try:
+        with timings.span("read"), open(path, 'rb') as pdf:
+            data = pdf.read()
+
+        if bank is None:
+            with timings.span("detect"):
+                text = first_page_text(data)
+                detected, confidence = BankParser.detect_bank(text) if text is not None else (None, 0.0)
+            if text is None:
+                raise ValueError("Not a readable PDF (damaged or password protected)")
+            if detected is None or confidence < CERTAIN_CONFIDENCE:
+                raise ValueError(f"Could not detect the bank (best guess {detected}, {confidence:.0%})")
+            summary["bank"] = detected
+
+        with diagnostics.use(diagnostics.LoggingDiagnostics()):
+            conversion = convert(data, summary["bank"], use_cache=use_cache, timings=timings)
+
+        summary["pages"] = conversion.stats.get("pages", 0)
+        if not conversion.accounts:
+            raise ValueError("Error parsing the data" if conversion.extracted else "Error processing the PDF")
+
+        target = export_name(output_stem, format_name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with timings.span("export"), diagnostics.use(diagnostics.LoggingDiagnostics()):
+            export_formats[format_name].write(target, conversion.accounts, Source(summary["bank"], conversion.key))
+        summary["outputs"].append(target)
+        summary["rows"] = conversion.stats["rows"]
+        summary["accounts"] = conversion.stats["accounts"]
+    except Exception as e:
+        summary["error"] = f"{type(e).__name__}: {e}"
+
+    summary["seconds"] = time.perf_counter() - started
+    summary["timings"] = timings.as_dict()
+    return summary
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Convert bank statement PDFs to Excel, CSV, Parquet or OFX files.")
+    parser.add_argument("inputs", nargs="+", help="PDF files, directories or glob patterns")
+    parser.add_argument("--bank", choices=BankParser.bank_names(), help="bank of every input; detected per file when omitted")
+    parser.add_argument("--output", default="output", help="directory for the converted files (default: output)")
+    parser.add_argument("--format", choices=list(export_formats), default="xlsx", help="output format (default: xlsx)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="parallel processes (default: CPU count)")
+    parser.add_argument("--no-cache", action="store_true", help="ignore and do not fill the conversion caches")
+    parser.add_argument("--verbose", action="store_true", help="log parser diagnostics")
+    args = parser.parse_args(argv)
+
+    paths = find_pdfs(args.inputs)
+    if not paths:
+        parser.error("no PDF files found")
+    stems = output_stems(paths, args.output)
+
+    started = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(args.verbose,)) as executor:
+        futures = [
+            executor.submit(convert_file, path, args.bank, stems[path], not args.no_cache, args.format)
+            for path in paths
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            results.append(result)
+            status = "FAILED " + result["error"] if result["error"] else f"{result['accounts']} account(s), {result['rows']} rows"
+            print(f"[{done}/{len(paths)}] {result['path']} ({result['bank']}, {result['seconds']:.2f}s): {status}")
+    elapsed = time.perf_counter() - started
+
+    failures = [result for result in results if result["error"]]
+    pages = sum(result["pages"] for result in results)
+    print()
+    print(f"Converted {len(results) - len(failures)}/{len(results)} files in {elapsed:.1f}s "
+          f"({len(results) / elapsed:.2f} files/s, {pages / elapsed:.1f} pages/s)")
+    if results:
+        timings = sorted(result["seconds"] for result in results)
+        print(f"Per file: median {timings[len(timings) // 2]:.2f}s, slowest {timings[-1]:.2f}s")
+
+        stages = {}
+        for result in results:
+            for stage, seconds in result["timings"].items():
+                stages[stage] = stages.get(stage, 0.0) + seconds
+        print("By stage: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in stages.items()))
+    for result in failures:
+        print(f"  FAILED {result['path']}: {result['error']}")
+
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
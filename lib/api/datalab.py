@@ -1,73 +1,327 @@
-import requests
-import streamlit as st
-from typing import Dict
-import time
-
-def parse(data: bytes) -> Dict:
-    """Call the DataLab API to recognize tables in the PDF."""
-    api_endpoint = "https://www.datalab.to/api/v1/table_rec"
-    api_key = st.secrets.datalab.api_key
-    
-    headers = {
-        "X-Api-Key": api_key
-    }
-    # Read PDF bytes
-    files = {
-        'file': ('uploaded.pdf', data, 'application/pdf')
-    }
-    
-    try:
-        response = requests.post(api_endpoint, headers=headers, files=files)
+import asyncio
+import httpx
+import numpy as np
+import os
+import pymupdf
+import threading
+
+from typing import Dict, List, NamedTuple, Optional
+
+from lib import diagnostics
+from lib.api.file import use_document
+
+# Point at a local stub server in development by setting DATALAB_URL
+DATALAB_URL = os.environ.get("DATALAB_URL", "https://www.datalab.to")
+TABLE_REC_PATH = "/api/v1/table_rec"
+
+# Polls start quick and back off while the job runs, up to POLL_MAX seconds
+# apart; the whole submission gives up after DEADLINE seconds
+POLL_INITIAL = 0.5
+POLL_MAX = 10.0
+POLL_BACKOFF = 1.5
+DEADLINE = 600.0
+MAX_CONNECTIONS = 20
+# Documents longer than CHUNK_PAGES are submitted as page-range chunks, at
+# most CHUNK_CONCURRENCY of them at a time
+CHUNK_PAGES = 10
+CHUNK_CONCURRENCY = 4
+
+_loop = None
+_loop_lock = threading.Lock()
+_clients = {}
+
+def api_key() -> str:
+    """
+    DataLab API key from DATALAB_API_KEY, else the Streamlit app's secrets
+    """
+    key = os.environ.get("DATALAB_API_KEY")
+    if key:
+        return key
+    # Only the app configures secrets, so only it pays for the import
+    import streamlit as st
+    return st.secrets.datalab.api_key
+
+class DataLabError(Exception):
+    """
+    A DataLab job that finished without a result
+    """
+
+class DataLabClient:
+    """
+    Asynchronous DataLab API client.
+
+    All requests share one connection pool, so it must only be used from
+    the event loop it was first used on (see `run`).
+    """
+
+    def __init__(self, api_key: str, base_url: str = DATALAB_URL, max_connections: int = MAX_CONNECTIONS):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self._http = None
+
+    def _client(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"X-Api-Key": self.api_key},
+                limits=httpx.Limits(max_connections=self.max_connections),
+                timeout=httpx.Timeout(60.0)
+            )
+        return self._http
+
+    async def submit(self, data: bytes, filename: str = "uploaded.pdf") -> str:
+        """
+        Start a table recognition job and return the URL to poll
+        """
+        files = {'file': (filename, data, 'application/pdf')}
+        response = await self._client().post(TABLE_REC_PATH, files=files)
         response.raise_for_status()
-        data = response.json()
-        check_url = data['request_check_url']
-        max_polls = 300
-        poll_interval = 2
+        return response.json()['request_check_url']
+
+    async def wait(self, check_url: str) -> Dict:
+        """
+        Poll a job until it completes, backing off between polls
+        """
+        interval = POLL_INITIAL
+        while True:
+            await asyncio.sleep(interval)
+            response = await self._client().get(check_url)
+            response.raise_for_status()
+            result = response.json()
+
+            if result['status'] == 'complete':
+                if result.get('success') is False:
+                    raise DataLabError(result.get('error') or "DataLab job failed")
+                return result
+
+            # Honour the server's hint when it gives one
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                interval = min(float(retry_after), POLL_MAX)
+            else:
+                interval = min(interval * POLL_BACKOFF, POLL_MAX)
+
+    async def table_rec(self, data: bytes, deadline: float = DEADLINE) -> List[Dict]:
+        """
+        Recognize the tables of a PDF, in page order
+        """
+        async with asyncio.timeout(deadline):
+            result = await self.wait(await self.submit(data))
+        return [table for page in result['pages'] or [] for table in page['tables']]
+
+    async def table_rec_each(
+        self,
+        chunks: List[bytes],
+        concurrency: int = CHUNK_CONCURRENCY,
+        deadline: float = DEADLINE
+    ) -> List[List[Dict]]:
+        """
+        Recognize several PDFs concurrently, returning each one's tables
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def recognize(chunk: bytes) -> List[Dict]:
+            async with semaphore:
+                return await self.table_rec(chunk, deadline)
+
+        # The deadline bounds the whole batch, however chunks queue up
+        async with asyncio.timeout(deadline):
+            return await asyncio.gather(*(recognize(chunk) for chunk in chunks))
+
+    async def table_rec_chunked(
+        self,
+        chunks: List[bytes],
+        concurrency: int = CHUNK_CONCURRENCY,
+        deadline: float = DEADLINE
+    ) -> List[Dict]:
+        """
+        Recognize the tables of a document split into page-range chunks.
 
-        for i in range(max_polls):
-            time.sleep(poll_interval)
+        Chunks run concurrently and are merged back in page order. Each
+        chunk numbers its cells' `order` from zero, so later chunks are
+        offset past the earlier ones to keep the order document-wide.
+        """
+        results = await self.table_rec_each(chunks, concurrency, deadline)
 
-            check_response = requests.get(check_url, headers=headers)
-            data = check_response.json()
+        tables = []
+        offset = 0
+        for chunk_tables in results:
+            last = -1
+            for table in chunk_tables:
+                for cell in table['cells']:
+                    last = max(last, cell['order'])
+                    cell['order'] += offset
+                tables.append(table)
+            offset += last + 1
+        return tables
 
-            if data['status'] == 'complete' and data['pages']:
-                tables = [table for page in data['pages'] for table in page['tables']]
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
 
-                return parse_tables(tables)
-            
-        st.error("DataLab API request timed out")
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            # One loop thread serves every upload waiting on DataLab
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="datalab", daemon=True).start()
+    return _loop
+
+def get_client(api_key: str, base_url: str = DATALAB_URL) -> DataLabClient:
+    """
+    Shared client for an API key, so uploads reuse pooled connections
+    """
+    with _loop_lock:
+        key = (api_key, base_url)
+        if key not in _clients:
+            _clients[key] = DataLabClient(api_key, base_url)
+        return _clients[key]
+
+def run(coroutine):
+    """
+    Run a coroutine on the shared DataLab loop and wait for its result.
+
+    If the waiting thread is interrupted (e.g. Streamlit stops the script),
+    the coroutine is cancelled rather than left polling.
+    """
+    future = asyncio.run_coroutine_threadsafe(coroutine, _get_loop())
+    try:
+        return future.result()
+    except BaseException:
+        future.cancel()
+        raise
+
+def split_pages(doc: pymupdf.Document, chunk_pages: int) -> List[bytes]:
+    """
+    Split a document into PDFs of at most `chunk_pages` pages each
+    """
+    chunks = []
+    for start in range(0, len(doc), chunk_pages):
+        part = pymupdf.open()
+        try:
+            part.insert_pdf(doc, from_page=start, to_page=min(start + chunk_pages, len(doc)) - 1)
+            chunks.append(part.tobytes())
+        finally:
+            part.close()
+    return chunks
+
+def parse(
+    data: bytes,
+    doc: Optional[pymupdf.Document] = None,
+    chunk_pages: Optional[int] = CHUNK_PAGES,
+    concurrency: int = CHUNK_CONCURRENCY
+) -> Dict:
+    """Call the DataLab API to recognize tables in the PDF.
+
+    `doc` is the already-open document shared by the caller. Documents
+    longer than `chunk_pages` are split and their chunks submitted
+    `concurrency` at a time; pass None to always send the whole file.
+    """
+    client = get_client(api_key())
+
+    chunks = None
+    if chunk_pages:
+        with use_document(data, doc) as handle:
+            if len(handle) > chunk_pages:
+                chunks = split_pages(handle, chunk_pages)
+
+    try:
+        if chunks:
+            tables = run(client.table_rec_chunked(chunks, concurrency))
+        else:
+            tables = run(client.table_rec(data))
+    except TimeoutError:
+        diagnostics.error("DataLab API request timed out")
         return None
-    except requests.exceptions.RequestException as e:
-        st.error(f"Error calling DataLab API: {str(e)}")
+    except (httpx.HTTPError, DataLabError) as e:
+        diagnostics.error(f"Error calling DataLab API: {str(e)}")
         return None
 
-def parse_tables(data: Dict) -> Dict:
-    rows_data = []
+    return parse_tables(tables)
 
-    # Loop through each table
-    for table in data:
-        rows = table['rows']
-        cells = table['cells']
+class TableRows(NamedTuple):
+    """
+    Recognized table rows in columnar form, one entry per row
+    """
+    table_order: np.ndarray
+    row: np.ndarray
+    # (rows, columns) cell texts, '' where `present` is False
+    text: np.ndarray
+    present: np.ndarray
 
-        # Map row_ids to their respective cell texts
-        row_dict = {}
-
-        for cell in cells:
-            order = cell['order']
+def table_rows(data: List[Dict]) -> TableRows:
+    """
+    Flatten DataLab tables into rows sorted by table order and row id.
 
+    Cells are exploded into one (row, column) entry per id they span, and
+    where several cells cover the same position the last one wins. A row's
+    table_order is the order of its first column's cell.
+    """
+    tables, rows, cols, orders, texts = [], [], [], [], []
+    for table_index, table in enumerate(data):
+        for cell in table['cells']:
+            text = cell['text'].strip()
             for row_id in cell['row_ids']:
-                if row_id not in row_dict:
-                    row_dict[row_id] = {}
                 for col_id in cell['col_ids']:
-                    row_dict[row_id][col_id] = {
-                        'text': cell['text'].strip(),
-                        'order': order  # Store the order for distinguishing tables
-                    }
-
-        # Structure each row as a dictionary and add to rows_data
-        for row_id, columns in row_dict.items():
-            row = {f"col_{col_id}": columns[col_id]['text'] for col_id in columns}
-            row['table_order'] = columns[next(iter(columns))]['order']  # Add the order to the row
-            rows_data.append(row)
-
-    return rows_data
\ No newline at end of file
+                    tables.append(table_index)
+                    rows.append(row_id)
+                    cols.append(col_id)
+                    orders.append(cell['order'])
+                    texts.append(text)
+
+    if not tables:
+        empty = np.zeros(0, dtype=np.int64)
+        return TableRows(empty, empty, np.zeros((0, 0), dtype=object), np.zeros((0, 0), dtype=bool))
+
+    tables = np.array(tables)
+    rows = np.array(rows)
+    cols = np.array(cols)
+    orders = np.array(orders)
+    texts = np.array(texts, dtype=object)
+    seq = np.arange(len(tables))
+
+    # Group entries by position in arrival order; a group's last entry is the
+    # cell that wrote it last and its first entry says when it first appeared
+    order = np.lexsort((seq, cols, rows, tables))
+    key = np.stack((tables[order], rows[order], cols[order]))
+    starts = np.flatnonzero(np.concatenate(([True], (np.diff(key, axis=1) != 0).any(axis=0))))
+    ends = np.concatenate((starts[1:], [len(order)])) - 1
+    first_seen = seq[order[starts]]
+    winners = order[ends]
+
+    # Each row in the output, and which of its positions appeared first
+    position_rows = np.stack((tables[winners], rows[winners]))
+    row_breaks = np.concatenate(([True], (np.diff(position_rows, axis=1) != 0).any(axis=0)))
+    row_starts = np.flatnonzero(row_breaks)
+    row_index = np.cumsum(row_breaks) - 1
+    by_first = np.lexsort((first_seen, row_index))
+    first_column = by_first[np.flatnonzero(np.concatenate(([True], np.diff(row_index[by_first]) != 0)))]
+
+    row_table = tables[winners[row_starts]]
+    row_ids = rows[winners[row_starts]]
+    row_orders = orders[winners[first_column]]
+
+    column_count = cols.max() + 1
+    text = np.full((len(row_starts), column_count), '', dtype=object)
+    present = np.zeros((len(row_starts), column_count), dtype=bool)
+    text[row_index, cols[winners]] = texts[winners]
+    present[row_index, cols[winners]] = True
+
+    output = np.lexsort((row_ids, row_table, row_orders))
+    return TableRows(row_orders[output], row_ids[output], text[output], present[output])
+
+def parse_tables(data: List[Dict]) -> List[Dict]:
+    """
+    Rows of DataLab tables as dictionaries of col_<id> texts plus table_order
+    """
+    table = table_rows(data)
+    columns = [f"col_{col_id}" for col_id in range(table.text.shape[1])]
+    rows_data = []
+    for table_order, texts, present in zip(table.table_order.tolist(), table.text.tolist(), table.present.tolist()):
+        row = {column: text for column, text, here in zip(columns, texts, present) if here}
+        row['table_order'] = table_order
+        rows_data.append(row)
+    return rows_data
@@ -1,27 +1,516 @@
+import json
+import numpy as np
+import os
 import pymupdf
-import tempfile
+import re
+import threading
 
-from typing import Dict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
 
-def parse(data: bytes) -> Dict:
+from lib.data.cache import PageCache, document_hash, page_cache
+from lib.processes import spawn_context
+
+# Documents with fewer pages than this are extracted serially: below it the
+# cost of shipping the bytes to the workers outweighs the parallel speed-up.
+PARALLEL_PAGE_THRESHOLD = 64
+MAX_WORKERS = os.cpu_count() or 1
+
+# Pages with less text than this cannot hold a movement
+MIN_PAGE_CHARS = 20
+# Sections that never hold movements; a page with one of them and no
+# movement line is skipped
+SKIP_KEYWORDS = ("IMPUESTOS DEBITADOS",)
+# A date as the banks print it (01/05, 01-05-24, 01-MAY) and an amount with cents
+DATE_PATTERN = re.compile(r"\b\d{1,2}[/-](?:\d{2}|[A-Z]{3})\b")
+AMOUNT_PATTERN = re.compile(r"\d[.,]\d{2}(?!\d)")
+MOVEMENT_LINE = re.compile(r"^\s*\d{1,2}[/-](?:\d{2}|[A-Z]{3})\b", re.MULTILINE)
+
+# Word boxes in points plus PyMuPDF's block, line and word numbers
+WORD_DTYPE = np.dtype([
+    ("x0", "f4"), ("y0", "f4"), ("x1", "f4"), ("y1", "f4"),
+    ("block", "i4"), ("line", "i4"), ("word", "i4")
+])
+
+_executor = None
+_executor_lock = threading.Lock()
+
+class PageText(str):
+    """
+    Text of one page that remembers its page number in the original document
+    """
+    number: int
+
+    def __new__(cls, text: str, number: int):
+        page = super().__new__(cls, text)
+        page.number = number
+        return page
+
+    def __getnewargs__(self) -> Tuple[str, int]:
+        # Lets pickle and deepcopy rebuild pages for process workers and single-flight waiters
+        return str(self), self.number
+
+Marker = Union[str, re.Pattern]
+
+class Triage(NamedTuple):
+    """
+    Rules for skipping pages that cannot contain movements
+    """
+    skip: Tuple[str, ...]
+    # Pages with a profile marker are always kept, whatever else they hold
+    keep: Tuple[Marker, ...]
+
+class PageWords(NamedTuple):
+    """
+    Words of one page as a WORD_DTYPE array with a parallel string table
+    """
+    number: int
+    words: np.ndarray
+    text: List[str]
+
+@contextmanager
+def open_document(data: bytes) -> Iterator[pymupdf.Document]:
+    """
+    Open a PDF straight from memory and close it when done
+    """
+    doc = pymupdf.open(stream=data, filetype="pdf")
+    try:
+        yield doc
+    finally:
+        doc.close()
+
+@contextmanager
+def use_document(data: bytes, doc: Optional[pymupdf.Document]) -> Iterator[pymupdf.Document]:
+    """
+    Reuse the caller's handle when given one, otherwise open one for the block.
+
+    Extractors take an optional `doc` so a caller holding the document open
+    can share it; this is how they get a handle either way.
+    """
+    if doc is not None:
+        yield doc
+    else:
+        with open_document(data) as doc:
+            yield doc
+
+def _map(fn, *iterables) -> Tuple[ProcessPoolExecutor, Iterator]:
+    """
+    Submit `fn` over the iterables to the shared pool, creating it on first use.
+
+    Submitting under the lock keeps a thread from scheduling work on a pool
+    another thread is replacing.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawned workers do not inherit the Streamlit server's threads
+            _executor = ProcessPoolExecutor(
+                max_workers=MAX_WORKERS,
+                mp_context=spawn_context()
+            )
+        try:
+            return _executor, _executor.map(fn, *iterables)
+        except BrokenProcessPool:
+            # The pool broke since the last extraction; the caller falls back
+            _executor.shutdown(wait=False)
+            _executor = None
+            raise
+
+def _reset_executor(broken: ProcessPoolExecutor) -> None:
+    """
+    Drop a broken pool so the next extraction starts a fresh one
+    """
+    global _executor
+    with _executor_lock:
+        # Another thread may already have replaced it
+        if _executor is broken:
+            _executor = None
+    # Futures still pending on a broken pool fail with BrokenProcessPool on
+    # their own; cancelling them would hand other threads a CancelledError
+    broken.shutdown(wait=False)
+
+def _page_ranges(page_count: int, chunks: int) -> List[Tuple[int, int]]:
+    """
+    Split [0, page_count) into at most `chunks` contiguous ranges
+    """
+    size, extra = divmod(page_count, chunks)
+    ranges = []
+    start = 0
+    for i in range(chunks):
+        stop = start + size + (1 if i < extra else 0)
+        if stop > start:
+            ranges.append((start, stop))
+        start = stop
+    return ranges
+
+def _clip_rect(page: pymupdf.Page, clip: Optional[Sequence[float]]) -> Optional[pymupdf.Rect]:
+    """
+    Turn a clip given as fractions of the page (x0, y0, x1, y1) into points
+    """
+    if clip is None:
+        return None
+    rect = page.rect
+    x0, y0, x1, y1 = clip
+    return pymupdf.Rect(
+        rect.x0 + rect.width * x0, rect.y0 + rect.height * y0,
+        rect.x0 + rect.width * x1, rect.y0 + rect.height * y1
+    )
+
+def _page_text(page: pymupdf.Page, clip: Optional[Sequence[float]], triage: Optional[Triage] = None) -> Optional[str]:
+    """
+    Extract a page's text, or return None when triage rules it out.
+
+    Only a page without fonts is ruled out before extraction: it has no
+    text layer, so it is never laid out. Every other signal needs the text
+    page, which costs as much as the extraction itself (a clipped text page
+    or `search_for` cost the same), so the remaining checks run on the
+    extracted text and only save the parser the page. They are ordered so
+    that a page with movements passes after a couple of regex searches, and
+    the profile markers are only looked for on pages about to be dropped.
+    """
+    if triage is None:
+        return page.get_text(clip=_clip_rect(page, clip))
+
+    if not page.get_fonts():
+        return None
+
+    textpage = page.get_textpage(clip=_clip_rect(page, clip))
+    text = page.get_text(textpage=textpage)
+    if len(text.strip()) < MIN_PAGE_CHARS or not (DATE_PATTERN.search(text) or AMOUNT_PATTERN.search(text)):
+        drop = True
+    elif MOVEMENT_LINE.search(text):
+        return text
+    else:
+        # Tax summaries carry dates and amounts too, but no line starts with a date
+        drop = any(page.search_for(keyword, textpage=textpage) for keyword in triage.skip)
+
+    # Pages with a profile marker are always kept, whatever else they hold
+    if drop and not (triage.keep and any(_has_marker(line, triage.keep) for line in text.split('\n'))):
+        return None
+    return text
+
+def _extract_range(
+    data: bytes,
+    start: int,
+    stop: int,
+    clip: Optional[Sequence[float]] = None,
+    triage: Optional[Triage] = None
+) -> List[Optional[str]]:
+    # Runs in a worker process, which opens its own handle on the bytes
+    with open_document(data) as doc:
+        return [_page_text(doc[number], clip, triage) for number in range(start, stop)]
+
+def _iter_pages_parallel(
+    data: bytes,
+    page_count: int,
+    workers: int,
+    clip: Optional[Sequence[float]],
+    triage: Optional[Triage]
+) -> Iterator[Optional[str]]:
+    ranges = _page_ranges(page_count, workers)
+    starts = [first for first, _ in ranges]
+    stops = [stop for _, stop in ranges]
+    count = len(ranges)
+
+    # map() yields chunk results in submission order, so pages stay in order
+    executor, chunks = _map(_extract_range, [data] * count, starts, stops, [clip] * count, [triage] * count)
+    try:
+        for chunk in chunks:
+            yield from chunk
+    except BrokenProcessPool:
+        _reset_executor(executor)
+        raise
+
+def _extract_pages(
+    data: bytes,
+    doc: Optional[pymupdf.Document],
+    parallel_threshold: Optional[int],
+    workers: int,
+    clip: Optional[Sequence[float]],
+    triage: Optional[Triage] = None
+) -> Iterator[PageText]:
+    with use_document(data, doc) as doc:
+        page_count = len(doc)
+        number = 0
+        # MAX_WORKERS caps every call; batch workers set it to 1 to stay serial
+        workers = min(workers, MAX_WORKERS)
+        if workers > 1 and parallel_threshold is not None and page_count >= parallel_threshold:
+            try:
+                for text in _iter_pages_parallel(data, page_count, workers, clip, triage):
+                    if text is not None:
+                        yield PageText(text, number)
+                    number += 1
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); finish serially, the
+                # next extraction starts a fresh pool
+                pass
+
+        while number < page_count:
+            text = _page_text(doc[number], clip, triage)
+            if text is not None:
+                yield PageText(text, number)
+            number += 1
+
+def _has_marker(line: str, markers: Sequence[Marker]) -> bool:
+    for marker in markers:
+        if isinstance(marker, str):
+            if marker in line:
+                return True
+        elif marker.search(line):
+            return True
+    return False
+
+def _find_line(lines: List[str], markers: Sequence[Marker], begin: int = 0) -> Optional[int]:
+    for index in range(begin, len(lines)):
+        if _has_marker(lines[index], markers):
+            return index
+    return None
+
+def _markers(value: Union[None, Marker, Sequence[Marker]]) -> Tuple[Marker, ...]:
+    if value is None:
+        return ()
+    if isinstance(value, (str, re.Pattern)):
+        return (value,)
+    return tuple(value)
+
+def apply_profile(pages: Iterator[PageText], profile: Dict) -> Iterator[PageText]:
+    """
+    Trim extracted pages to the region a bank's parser actually reads.
+
+    Markers are substrings or compiled patterns matched line by line, the
+    same way the parsers look for them:
+
+    - start: pages before the first line with a start marker are dropped,
+      as is the text above that line
+    - stop: the text after the first line with a stop marker (after the
+      start) is dropped and the remaining pages are never extracted
+    - page_start: on every page, the text above the first line with one of
+      these markers is dropped; pages without any are kept whole
+    """
+    start = _markers(profile.get("start"))
+    stop = _markers(profile.get("stop"))
+    page_start = _markers(profile.get("page_start"))
+    if not (start or stop or page_start):
+        yield from pages
+        return
+
+    started = not start
+    for text in pages:
+        lines = text.split('\n')
+        first = 0
+        # The stop marker is only looked for below the start line
+        search_from = 0
+        if not started:
+            found = _find_line(lines, start)
+            if found is None:
+                continue
+            started = True
+            first = found
+            search_from = found + 1
+        elif page_start:
+            found = _find_line(lines, page_start)
+            if found is not None:
+                first = search_from = found
+
+        if stop:
+            found = _find_line(lines, stop, search_from)
+            if found is not None:
+                yield PageText('\n'.join(lines[first:found + 1]), text.number)
+                # The source is never pulled again, so the pages left are not extracted
+                return
+
+        yield text if first == 0 else PageText('\n'.join(lines[first:]), text.number)
+
+def _triage(profile: Dict) -> Optional[Triage]:
+    if not profile.get("triage"):
+        return None
+    keep = _markers(profile.get("start")) + _markers(profile.get("stop")) + _markers(profile.get("page_start"))
+    return Triage(tuple(profile.get("skip", SKIP_KEYWORDS)), keep)
+
+def _describe(profile: Optional[Dict]) -> Optional[str]:
+    # Stable description of a profile for cache keys; patterns by their source
+    if not profile:
+        return None
+    return json.dumps(profile, sort_keys=True, default=lambda value: value.pattern)
+
+def extraction_settings(profile: Optional[Dict]) -> Dict:
+    """
+    Everything besides the bytes that shapes the text extracted with a
+    profile, for keying caches of that text and of what is parsed from it
+    """
+    profile = profile or {}
+    triage = _triage(profile)
+    return {
+        "pymupdf": pymupdf.VersionBind,
+        "profile": _describe(profile),
+        "triage": None if triage is None else {
+            "skip": list(triage.skip),
+            "min_chars": MIN_PAGE_CHARS,
+            "patterns": [DATE_PATTERN.pattern, AMOUNT_PATTERN.pattern, MOVEMENT_LINE.pattern]
+        }
+    }
+
+def iter_pages(
+    data: bytes,
+    doc: Optional[pymupdf.Document] = None,
+    parallel_threshold: Optional[int] = PARALLEL_PAGE_THRESHOLD,
+    workers: int = MAX_WORKERS,
+    cache: Optional[PageCache] = page_cache,
+    profile: Optional[Dict] = None
+) -> Iterator[PageText]:
+    """
+    Yield the text of each page in order, extracting lazily
+
+    Documents with at least `parallel_threshold` pages are split across a
+    process pool of `workers` processes; pass None to always run serially.
+    Serially only the current page is held in memory, so consumers that read
+    page by page stay bounded by a page rather than the whole document.
+
+    Pages already extracted for the same bytes are replayed from `cache`
+    without touching PyMuPDF; pass None to bypass it.
+
+    A bank's extraction `profile` narrows what is pulled from each page: a
+    `clip` rectangle given as fractions of the page (x0, y0, x1, y1), plus
+    the marker rules described in `apply_profile`. With `triage` set, pages
+    that cannot hold movements are left out of what the parser reads (see
+    `_page_text`); `skip` overrides the SKIP_KEYWORDS that mark such pages.
+
+    Every page is a PageText whose `number` is its zero-based page number in
+    the document, so parsers can tell which pages were skipped.
+    """
+    profile = profile or {}
+    triage = _triage(profile)
+    if cache is not None:
+        digest = document_hash(data)
+        key = cache.key(digest, {"mode": "text", **extraction_settings(profile)})
+        cached = cache.get(key)
+        if cached is not None:
+            for number, text in cached:
+                yield PageText(text, number)
+            return
+
+    # The PDF is only opened on a miss
+    with use_document(data, doc) as doc:
+        pages = apply_profile(
+            _extract_pages(data, doc, parallel_threshold, workers, profile.get("clip"), triage),
+            profile
+        )
+        if cache is None:
+            yield from pages
+        else:
+            cache.put_page_count(digest, len(doc))
+            for number, text in cache.put(key, ((page.number, page) for page in pages)):
+                yield PageText(text, number)
+
+def parse(
+    data: bytes,
+    doc: Optional[pymupdf.Document] = None,
+    parallel_threshold: Optional[int] = PARALLEL_PAGE_THRESHOLD,
+    workers: int = MAX_WORKERS,
+    cache: Optional[PageCache] = page_cache,
+    profile: Optional[Dict] = None
+) -> List[PageText]:
     """
     Parse tables in a PDF file
     """
-    with tempfile.NamedTemporaryFile(delete=True, suffix='.pdf') as temp_file:
-        temp_file.write(data)
-        temp_file.flush()
-        doc = pymupdf.open(temp_file.name)
+    return list(iter_pages(data, doc, parallel_threshold, workers, cache, profile))
 
-    return [page.get_text() for page in doc]
+def _page_words(page: pymupdf.Page) -> PageWords:
+    raw = page.get_text("words")
+    words = np.array(
+        [(x0, y0, x1, y1, block, line, word) for x0, y0, x1, y1, _, block, line, word in raw],
+        dtype=WORD_DTYPE
+    )
+    return PageWords(page.number, words, [entry[4] for entry in raw])
 
-def stats(data: bytes) -> Dict:
+def iter_words(data: bytes, doc: Optional[pymupdf.Document] = None) -> Iterator[PageWords]:
     """
-    Get stats from a PDF file
+    Yield the words of each page with their coordinates, page by page
+    """
+    with use_document(data, doc) as doc:
+        for page in doc:
+            yield _page_words(page)
+
+def words(data: bytes, doc: Optional[pymupdf.Document] = None) -> List[PageWords]:
+    """
+    Word-level extraction for parsers that work on coordinates
+    """
+    return list(iter_words(data, doc))
+
+def group_rows(page: PageWords, tolerance: float = 3.0) -> np.ndarray:
+    """
+    Number the visual row of every word.
+
+    Words are ordered by their top edge and a new row starts wherever the gap
+    to the previous word's top edge exceeds `tolerance` points.
+    """
+    rows = np.zeros(len(page.words), dtype=np.int32)
+    if len(page.words) == 0:
+        return rows
+
+    order = np.argsort(page.words["y0"], kind="stable")
+    gaps = np.diff(page.words["y0"][order]) > tolerance
+    rows[order] = np.concatenate(([0], np.cumsum(gaps)))
+    return rows
+
+def assign_columns(page: PageWords, edges: List[float]) -> np.ndarray:
+    """
+    Bucket every word into a column given the x coordinates between columns.
+
+    A word belongs to the column its horizontal centre falls in, so column i
+    spans [edges[i - 1], edges[i]) and the last one is open to the right.
+    """
+    centres = (page.words["x0"] + page.words["x1"]) / 2
+    return np.searchsorted(np.asarray(edges, dtype=np.float32), centres, side="right")
+
+def page_lines(page: PageWords, tolerance: float = 3.0) -> List[str]:
+    """
+    Rebuild the page as text lines, one per visual row, words left to right
+    """
+    if len(page.words) == 0:
+        return []
+
+    rows = group_rows(page, tolerance)
+    order = np.lexsort((page.words["x0"], rows))
+    boundaries = np.flatnonzero(np.diff(rows[order])) + 1
+    return [
+        " ".join(page.text[index] for index in row)
+        for row in np.split(order, boundaries)
+    ]
+
+def first_page_text(data: bytes, doc: Optional[pymupdf.Document] = None) -> Optional[str]:
+    """
+    Text of the first page, enough to tell which bank issued the statement.
+
+    Returns None when the bytes are not a PDF that can be read: damaged, not
+    a PDF at all, or encrypted with a password.
+    """
+    try:
+        with use_document(data, doc) as doc:
+            if doc.needs_pass:
+                return None
+            return doc[0].get_text() if len(doc) else ""
+    except (pymupdf.FileDataError, ValueError):
+        # Opening raises FileDataError; reading an encrypted page raises ValueError
+        return None
+
+def stats(data: bytes, doc: Optional[pymupdf.Document] = None, cache: Optional[PageCache] = page_cache) -> Dict:
+    """
+    Get stats from a PDF file.
+
+    The page count is kept in `cache`, so a document seen before is not
+    opened for it; pass None to bypass it.
     """
-    with tempfile.NamedTemporaryFile(delete=True, suffix='.pdf') as temp_file:
-        temp_file.write(data)
-        temp_file.flush()
-        doc = pymupdf.open(temp_file.name)
-        stats = { "pages": len(doc) }
+    if cache is None:
+        with use_document(data, doc) as doc:
+            return { "pages": len(doc) }
 
-    return stats
+    digest = document_hash(data)
+    pages = cache.get_page_count(digest)
+    if pages is None:
+        with use_document(data, doc) as doc:
+            pages = len(doc)
+        cache.put_page_count(digest, pages)
+    return { "pages": pages }
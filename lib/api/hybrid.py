@@ -0,0 +1,86 @@
+import httpx
+import pymupdf
+
+from typing import Dict, List, Optional
+
+from lib import diagnostics
+from lib.api import datalab
+from lib.api.file import MIN_PAGE_CHARS, PageText, apply_profile, use_document
+
+# Share of unprintable characters past which a text layer is taken as
+# garbled, as fonts without a unicode map extract that way
+GARBLED_RATIO = 0.1
+
+def _usable(page: pymupdf.Page, text: str) -> bool:
+    """
+    Whether a page's own text layer can be parsed, or it must be recognized
+    """
+    stripped = text.strip()
+    if len(stripped) < MIN_PAGE_CHARS:
+        # A nearly empty page is only worth recognizing if it is a scan
+        return not page.get_images()
+
+    garbled = sum(1 for char in stripped if char == '\ufffd' or not (char.isprintable() or char.isspace()))
+    return garbled / len(stripped) < GARBLED_RATIO
+
+def _page_pdf(doc: pymupdf.Document, number: int) -> bytes:
+    part = pymupdf.open()
+    try:
+        part.insert_pdf(doc, from_page=number, to_page=number)
+        return part.tobytes()
+    finally:
+        part.close()
+
+def _render(tables: List[Dict]) -> str:
+    """
+    Lay recognized tables out as text lines, cells separated by two spaces
+    """
+    lines = []
+    for row in datalab.parse_tables(tables):
+        columns = sorted((key for key in row if key.startswith("col_")), key=lambda key: int(key[4:]))
+        lines.append("  ".join(row[key] for key in columns))
+    return "\n".join(lines)
+
+def _recognize(doc: pymupdf.Document, numbers: List[int]) -> Dict[int, str]:
+    """
+    Send only the given pages to DataLab, one single-page PDF each
+    """
+    client = datalab.get_client(datalab.api_key())
+    chunks = [_page_pdf(doc, number) for number in numbers]
+
+    try:
+        results = datalab.run(client.table_rec_each(chunks))
+    except (TimeoutError, httpx.HTTPError, datalab.DataLabError) as e:
+        diagnostics.warning(f"Could not recognize {len(numbers)} scanned page(s): {str(e)}")
+        return {}
+
+    return {number: _render(tables) for number, tables in zip(numbers, results)}
+
+def parse(
+    data: bytes,
+    doc: Optional[pymupdf.Document] = None,
+    profile: Optional[Dict] = None
+) -> List[PageText]:
+    """
+    Extract text locally, recognizing remotely only the pages that need it.
+
+    Pages without a usable text layer (scans, garbled fonts) go to DataLab
+    and come back as text lines; every other page keeps PyMuPDF's text.
+    The profile's markers are applied to the merged pages; its clip and
+    triage are not, as triage would drop exactly the scanned pages this is
+    for.
+    """
+    with use_document(data, doc) as handle:
+        texts = {}
+        remote = []
+        for page in handle:
+            # Unusable text is still kept in case recognition fails
+            texts[page.number] = page.get_text()
+            if not _usable(page, texts[page.number]):
+                remote.append(page.number)
+
+        if remote:
+            texts.update(_recognize(handle, remote))
+
+    pages = (PageText(texts[number], number) for number in sorted(texts))
+    return list(apply_profile(pages, profile or {}))
@@ -0,0 +1,108 @@
+import copy
+import threading
+
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterator, Tuple
+
+from lib.data.cache import document_hash
+
+# Handed to waiters when the leader's result was a stream they cannot share
+_REPLAY = object()
+
+class _Stream:
+    """
+    Iterator over a leader's page stream that reports when it is done with.
+
+    Finishing covers exhaustion, errors, an explicit close and the stream
+    being dropped unread, so waiters are never left blocked.
+    """
+
+    def __init__(self, pages: Iterator, done: Callable[[], None]):
+        self._pages = pages
+        self._done = done
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._pages)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        if self._done is not None:
+            done, self._done = self._done, None
+            try:
+                close = getattr(self._pages, "close", None)
+                if close is not None:
+                    close()
+            finally:
+                done()
+
+    def __del__(self):
+        self.close()
+
+class SingleFlight:
+    """
+    Share one in-flight call among concurrent callers with the same key.
+
+    The first caller for a key runs the call; callers arriving while it
+    runs wait and get its result (or exception). Results are shared as deep
+    copies so a parser mutating its input cannot affect another session.
+
+    A call that returns an iterator cannot be shared, so waiters wait until
+    the leader has read it to the end and then make their own call; the page
+    cache the leader filled makes that a replay rather than an extraction.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+
+    def _claim(self, key: str) -> Tuple[Future, bool]:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def _finish(self, key: str, future: Future, result=None, error: BaseException = None) -> None:
+        with self._lock:
+            del self._calls[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: str, fn: Callable, *args, **kwargs):
+        future, leader = self._claim(key)
+        if not leader:
+            result = future.result()
+            if result is _REPLAY:
+                return fn(*args, **kwargs)
+            return copy.deepcopy(result)
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as error:
+            self._finish(key, future, error=error)
+            raise
+
+        if isinstance(result, Iterator):
+            return _Stream(result, lambda: self._finish(key, future, _REPLAY))
+
+        self._finish(key, future, result)
+        return result
+
+    def wrap(self, name: str, extractor: Callable) -> Callable:
+        """
+        Deduplicate an extractor's concurrent calls on the same document bytes
+        """
+        def extract(data: bytes, *args, **kwargs):
+            return self.do(f"{name}:{document_hash(data)}", extractor, data, *args, **kwargs)
+        return extract
+
+single_flight = SingleFlight()
@@ -0,0 +1,88 @@
+from contextlib import closing, nullcontext
+from itertools import chain
+from typing import Dict, List, NamedTuple, Optional
+
+from lib.api.file import extraction_settings, open_document, stats
+from lib.data.cache import document_hash, page_cache, result_cache
+from lib.parsers.base import BankParser
+from lib.timing import Timings
+
+class Conversion(NamedTuple):
+    """
+    Outcome of converting one statement
+    """
+    # One list of canonical rows per account, or None when nothing parsed
+    accounts: Optional[List[List[Dict]]]
+    # Whether extraction produced anything, to tell PDF and parser failures apart
+    extracted: bool
+    stats: Dict
+    # Identifies the result (document, bank, parser version and extraction) for caching its exports
+    key: str
+
+def convert(data: bytes, bank: str, use_cache: bool = True, timings: Optional[Timings] = None) -> Conversion:
+    """
+    Extract and parse a statement with the given bank's parser.
+
+    Works without Streamlit: whatever the core reports goes to the sink set
+    with `lib.diagnostics.use`. Stage timings go to `timings`, so a caller
+    can add its own stages to the same record, and are copied into the stats.
+    With `use_cache` off neither the result cache nor the page cache is read
+    or filled.
+    """
+    timings = timings or Timings()
+    parser = BankParser.get_parser(bank)
+
+    # A statement already converted by this parser version, from text
+    # extracted the same way, comes back from the cache
+    extractor_path, profile = BankParser.get_extraction(bank)
+    extraction = {"extractor": extractor_path, **extraction_settings(profile)}
+    result_key = result_cache.key(document_hash(data), bank, parser.version, extraction)
+    accounts = result_cache.get(result_key) if use_cache else None
+    extracted = accounts is not None
+    cached = extracted
+
+    # With the caches on the PDF is only opened by an extraction that misses
+    # the page cache, and stats read the page count it recorded. Without
+    # them one in-memory handle serves extraction and stats.
+    with nullcontext() if use_cache else open_document(data) as doc:
+        if accounts is None:
+            extractor = BankParser.get_parser_api(bank, use_cache)
+            with timings.span("extract"):
+                stream = extractor(data, doc=doc)
+
+            # A stream is closed even when the parser fails, since callers
+            # waiting on the same extraction are only released once it is
+            with closing(stream) if hasattr(stream, "close") else nullcontext():
+                if isinstance(stream, list):
+                    pages = stream
+                    extracted = bool(pages)
+                else:
+                    # Streamed pages are extracted while the parser reads them;
+                    # the first is read ahead to tell an empty extraction apart
+                    pages = timings.iterate("extract", stream)
+                    first = next(pages, None)
+                    extracted = first is not None
+                    pages = chain([first], pages)
+
+                if extracted:
+                    with timings.span("parse"):
+                        accounts = parser.parse(pages)
+
+                    if use_cache and not isinstance(pages, list):
+                        # The page cache only keeps a document read to the end;
+                        # extract what a parser that stops early left behind
+                        for _ in pages:
+                            pass
+
+            if accounts and use_cache:
+                result_cache.put(result_key, accounts)
+
+        file_stats = stats(data, doc=doc, cache=page_cache if use_cache else None)
+
+    file_stats['bank'] = bank
+    file_stats['bytes'] = len(data)
+    file_stats['accounts'] = len(accounts) if accounts else 0
+    file_stats['rows'] = sum(len(account) for account in accounts) if accounts else 0
+    file_stats['cached'] = cached
+    file_stats['timings'] = timings.as_dict()
+    return Conversion(accounts or None, extracted, file_stats, result_key)
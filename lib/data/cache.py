@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+CACHE_DIR = os.environ.get("CONVERTER_CACHE_DIR", ".cache")
+
+def document_hash(data: bytes) -> str:
+    """
+    Content address of an uploaded document
+    """
+    return hashlib.sha256(data).hexdigest()
+
+class DiskCache:
+    """
+    Directory of cache entries evicted least-recently-used past `max_bytes`.
+
+    Entries are files or directories named by key; reading an entry touches
+    its mtime, which is what eviction orders by.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def evict(self) -> None:
+        """
+        Drop least recently used entries until the cache fits in max_bytes
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            # Dot-prefixed names are entries still being written
+            if entry.name.startswith('.'):
+                continue
+            try:
+                if entry.is_dir():
+                    size = sum(part.stat().st_size for part in os.scandir(entry.path))
+                else:
+                    size = entry.stat().st_size
+                entries.append((entry.stat().st_mtime, size, entry.path))
+            except FileNotFoundError:
+                # Another thread or worker evicted it meanwhile
+                continue
+            total += size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+class PageCache(DiskCache):
+    """
+    Extracted page text on local disk, keyed by document hash and settings.
+
+    Each entry is a directory holding one zlib-compressed file per page,
+    named by the page's number in the document, so hits can be replayed page
+    by page with their numbers. Entries are published with an atomic
+    rename once every page has been written. Each document's page count is
+    kept beside them, so a hit never needs the PDF opened.
+    """
+
+    def key(self, digest: str, settings: Dict) -> str:
+        """
+        Combine a document hash with the extraction settings that shaped its text
+        """
+        payload = json.dumps({"document": digest, "settings": settings}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Iterator[Tuple[int, str]]]:
+        """
+        Return an iterator of (page number, text) for a cached entry, or None on a miss.
+
+        Every page file is read before returning, so an entry evicted while
+        it is being read is a miss rather than a parse failing halfway
+        through. Pages are only decompressed as they are consumed.
+        """
+        path = self._path(key)
+        try:
+            names = sorted(os.listdir(path))
+            # Touching the entry marks it as recently used for eviction
+            os.utime(path)
+            compressed = []
+            for name in names:
+                with open(os.path.join(path, name), 'rb') as page_file:
+                    compressed.append((int(name), page_file.read()))
+        except FileNotFoundError:
+            return None
+
+        return ((number, zlib.decompress(page).decode('utf-8')) for number, page in compressed)
+
+    def put(self, key: str, pages: Iterable[Tuple[int, str]]) -> Iterator[Tuple[int, str]]:
+        """
+        Pass pages through while writing them to the cache.
+
+        The entry is only published if the consumer reads every page; an
+        abandoned or failed extraction leaves nothing behind. Consumers that
+        stop early should drain the rest to have the document cached.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        staging = os.path.join(self.directory, f".{key}.{uuid.uuid4().hex}")
+        os.makedirs(staging)
+        published = False
+
+        try:
+            for number, text in pages:
+                with open(os.path.join(staging, f"{number:06d}"), 'wb') as page_file:
+                    page_file.write(zlib.compress(text.encode('utf-8')))
+                yield number, text
+
+            try:
+                os.rename(staging, self._path(key))
+                published = True
+            except OSError:
+                # Another conversion of the same document published it first
+                pass
+        finally:
+            if not published:
+                shutil.rmtree(staging, ignore_errors=True)
+
+        if published:
+            self.evict()
+
+    def get_page_count(self, digest: str) -> Optional[int]:
+        """
+        Page count recorded for a document, or None when it is not known
+        """
+        path = self._path(self.key(digest, {"mode": "page_count"}))
+        try:
+            with open(path) as count_file:
+                count = int(count_file.read())
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return count
+
+    def put_page_count(self, digest: str, count: int) -> None:
+        """
+        Record a document's page count, so stats on it never open the PDF again
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        key = self.key(digest, {"mode": "page_count"})
+        staging = os.path.join(self.directory, f".{key}.{uuid.uuid4().hex}")
+        with open(staging, 'w') as count_file:
+            count_file.write(str(count))
+        os.replace(staging, self._path(key))
+
+class ResultCache(DiskCache):
+    """
+    Parsed accounts on local disk, keyed by document hash, bank, parser
+    version and the extraction that fed the parser.
+
+    Parsers carry an explicit `version` string, so bumping it when a parser
+    changes makes every result it produced unreachable, as does changing
+    the bank's extractor or its profile; the stale entries then age out
+    through eviction.
+    """
+
+    def key(self, digest: str, bank: str, version: str, extraction: Dict) -> str:
+        payload = json.dumps(
+            {"document": digest, "bank": bank, "version": version, "extraction": extraction},
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[List[List[Dict]]]:
+        """
+        Return the cached accounts, or None on a miss
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as result_file:
+                accounts = json.loads(zlib.decompress(result_file.read()))
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+
+        return accounts
+
+    def put(self, key: str, accounts: List[List[Dict]]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        staging = os.path.join(self.directory, f".{key}.{uuid.uuid4().hex}")
+        with open(staging, 'wb') as result_file:
+            result_file.write(zlib.compress(json.dumps(accounts).encode('utf-8')))
+        os.replace(staging, self._path(key))
+        self.evict()
+
+# Compressed statement text is small; 512 MiB holds thousands of uploads
+page_cache = PageCache(os.path.join(CACHE_DIR, "pages"), max_bytes=512 * 1024 * 1024)
+result_cache = ResultCache(os.path.join(CACHE_DIR, "results"), max_bytes=256 * 1024 * 1024)
@@ -27,26 +27,45 @@ class UsageTracker:
 
         retry_db_operation(_create)
 
-    def record_conversion(self, stats: Dict) -> None:
+    def record_conversion(self, stats: Dict) -> int:
         """
-        Record a conversion event for the current user in the database
+        Record a conversion event for the current user in the database and
+        return its id
         """
         username = st.session_state.get('username', 'anonymous')
 
         def _record():
             conn = st.connection('postgres')
             session = conn.session
-            session.execute(
+            usage_id = session.execute(
                 text("""
                 INSERT INTO usages (user_name, stats, timestamp)
                 VALUES (:user, :stats, CURRENT_TIMESTAMP)
+                RETURNING id
                 """),
                 {'user': username, 'stats': json.dumps(stats)}
+            ).scalar()
+            session.commit()
+            return usage_id
+
+        return retry_db_operation(_record)
+
+    def update_stats(self, usage_id: int, stats: Dict) -> None:
+        """
+        Replace the stats of a recorded conversion, for figures only known
+        after it was recorded
+        """
+        def _update():
+            conn = st.connection('postgres')
+            session = conn.session
+            session.execute(
+                text("UPDATE usages SET stats = :stats WHERE id = :id"),
+                {'id': usage_id, 'stats': json.dumps(stats)}
             )
             session.commit()
             return True
 
-        retry_db_operation(_record)
+        retry_db_operation(_update)
 
     def get_user_stats(self, username: Optional[str] = None) -> Dict:
         """
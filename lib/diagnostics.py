@@ -0,0 +1,97 @@
+import logging
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator
+
+logger = logging.getLogger("converter")
+
+class Diagnostics:
+    """
+    Where the conversion core reports what it is doing; this one drops it all.
+
+    `write` and `json` are debug output, `warning` and `error` are problems
+    the user may need to see.
+    """
+
+    def write(self, *objects: Any) -> None:
+        pass
+
+    def json(self, body: Any) -> None:
+        pass
+
+    def warning(self, message: str) -> None:
+        pass
+
+    def error(self, message: str) -> None:
+        pass
+
+class LoggingDiagnostics(Diagnostics):
+    """
+    Diagnostics for batch workers and scripts, through the `converter` logger
+    """
+
+    def write(self, *objects: Any) -> None:
+        logger.debug(" ".join(str(item) for item in objects))
+
+    def json(self, body: Any) -> None:
+        logger.debug("%s", body)
+
+    def warning(self, message: str) -> None:
+        logger.warning(message)
+
+    def error(self, message: str) -> None:
+        logger.error(message)
+
+class StreamlitDiagnostics(Diagnostics):
+    """
+    Diagnostics rendered on the page; debug output only when `verbose`
+    """
+
+    def __init__(self, verbose: bool = False):
+        # Imported here so the core never needs Streamlit to load
+        import streamlit as st
+        self.st = st
+        self.verbose = verbose
+
+    def write(self, *objects: Any) -> None:
+        if self.verbose:
+            self.st.write(*objects)
+
+    def json(self, body: Any) -> None:
+        if self.verbose:
+            self.st.json(body)
+
+    def warning(self, message: str) -> None:
+        self.st.warning(message)
+
+    def error(self, message: str) -> None:
+        self.st.error(message)
+
+_sink: ContextVar[Diagnostics] = ContextVar("diagnostics", default=Diagnostics())
+
+def current() -> Diagnostics:
+    return _sink.get()
+
+@contextmanager
+def use(sink: Diagnostics) -> Iterator[Diagnostics]:
+    """
+    Send the diagnostics of the current thread or task to `sink` for a block
+    """
+    token = _sink.set(sink)
+    try:
+        yield sink
+    finally:
+        _sink.reset(token)
+
+def write(*objects: Any) -> None:
+    current().write(*objects)
+
+def json(body: Any) -> None:
+    current().json(body)
+
+def warning(message: str) -> None:
+    current().warning(message)
+
+def error(message: str) -> None:
+    current().error(message)
@@ -0,0 +1,360 @@
+import csv
+import hashlib
+import io
+import re
+import unicodedata
+import zipfile
+
+from contextlib import contextmanager, nullcontext
+from datetime import date
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+from xml.sax.saxutils import escape
+
+import xlsxwriter
+
+from lib import diagnostics
+
+EXCEL_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# Archives stay in memory up to this size and spill to a temporary file past it
+SPOOL_MAX_BYTES = 32 * 1024 * 1024
+
+# Columns every parser produces, in output order
+CANONICAL_COLUMNS = ("FECHA", "DETALLE", "REFERENCIA", "DEBITOS", "CREDITOS", "SALDO")
+AMOUNT_COLUMNS = ("DEBITOS", "CREDITOS", "SALDO")
+# Columnar exports put every account in one table, told apart by this column
+ACCOUNT_COLUMN = "CUENTA"
+
+DATE_COLUMN = "FECHA"
+DATE_FORMAT = "DD/MM/YYYY"
+# Statements print dates as d/mm/yy, dd/mm/yyyy or with dashes
+DATE_PATTERN = re.compile(r"(\d{1,2})[/-](\d{1,2})[/-](\d{2}|\d{4})")
+# Digits with thousands and decimal separators, once sign and currency are stripped
+AMOUNT_PATTERN = re.compile(r"\d(?:[\d.,]*\d)?")
+
+PARQUET_COMPRESSION = "zstd"
+OFX_CURRENCY = "ARS"
+# Statements do not carry a routing number; importers match on the account id
+OFX_BANK_ID = "000000000"
+# OFX limits ACCTID to 22 characters
+OFX_ACCOUNT_ID_LENGTH = 22
+# OFX limits NAME to 32 characters; the full detail goes to MEMO
+OFX_NAME_LENGTH = 32
+
+Target = Union[str, BinaryIO]
+
+class Source(NamedTuple):
+    """
+    The conversion a statement's rows come from, for formats that identify
+    accounts and movements across files
+    """
+    bank: str
+    # Unique to the document, bank and extraction (see lib.converter.Conversion)
+    key: str
+
+def parse_date(value: str) -> Union[date, str]:
+    """
+    Statement date as a date, or the text unchanged when it is not one
+    """
+    match = DATE_PATTERN.fullmatch(value.strip()) if isinstance(value, str) else None
+    if match is None:
+        return value
+
+    day, month, year = (int(part) for part in match.groups())
+    if year < 100:
+        year += 2000
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return value
+
+def parse_amount(value: Union[float, str]) -> Union[float, str]:
+    """
+    Amount as a number, or the value unchanged when it is not one.
+
+    Some parsers leave amounts as printed ("1.234,56", "1234,56-",
+    "9,813,718.17"). The last separator is the decimal one, unless it is the
+    only one and is followed by three digits ("1.234"), or is repeated.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    if not isinstance(value, str):
+        return value
+
+    text = value.strip().replace("$", "").replace(" ", "")
+    negative = text.startswith("-") or text.endswith("-")
+    text = text.strip("-")
+    if not AMOUNT_PATTERN.fullmatch(text):
+        return value
+
+    separators = [char for char in text if char in ".,"]
+    decimal = None
+    if separators:
+        last = separators[-1]
+        if len(set(separators)) == 2:
+            if separators.count(last) > 1:
+                return value
+            decimal = last
+        elif separators.count(last) == 1 and len(text) - text.rfind(last) - 1 != 3:
+            decimal = last
+
+    if decimal is not None:
+        whole, fraction = text.rsplit(decimal, 1)
+        text = f"{whole.replace('.', '').replace(',', '')}.{fraction}"
+    else:
+        text = text.replace('.', '').replace(',', '')
+    amount = float(text)
+    return -amount if negative else amount
+
+def canonical_value(key: str, value):
+    """
+    A row's value typed by its column: dates as dates, amounts as numbers
+    """
+    if key == DATE_COLUMN:
+        return parse_date(value)
+    if key in AMOUNT_COLUMNS:
+        return parse_amount(value)
+    return value
+
+def _number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def columns(account: List[Dict]) -> List[str]:
+    """
+    Every key of an account's rows, in first-seen order
+    """
+    return list(dict.fromkeys(key for row in account for key in row))
+
+@contextmanager
+def _binary(target: Target) -> Iterator[BinaryIO]:
+    # Writers take a path or an open binary file; only paths are closed here
+    with open(target, 'wb') if isinstance(target, str) else nullcontext(target) as output:
+        yield output
+
+def _blank(value) -> bool:
+    return value is None or value == ""
+
+def write_workbook(target: Target, accounts: List[List[Dict]], source: Optional[Source] = None) -> None:
+    """
+    Write a statement as one workbook with a sheet per account.
+
+    In constant memory mode each row is flushed to disk once the next one
+    starts, so large accounts never hold every cell in memory. Amounts are
+    numbers, blanks are empty cells and dates are real dates.
+    """
+    workbook = xlsxwriter.Workbook(target, {"constant_memory": True})
+    date_format = workbook.add_format({"num_format": DATE_FORMAT})
+    for account_index, account in enumerate(accounts, 1):
+        sheet = workbook.add_worksheet(f"Account {account_index}")
+        header = columns(account)
+        sheet.write_row(0, 0, header)
+
+        for row_index, row in enumerate(account, 1):
+            for column_index, key in enumerate(header):
+                value = row.get(key, "")
+                if _blank(value):
+                    continue
+                value = canonical_value(key, value)
+                if _number(value):
+                    sheet.write_number(row_index, column_index, value)
+                elif isinstance(value, date):
+                    sheet.write_datetime(row_index, column_index, value, date_format)
+                else:
+                    # Text is written as text, never as a formula or link
+                    sheet.write_string(row_index, column_index, str(value))
+
+    workbook.close()
+
+def write_csv(target: Target, accounts: List[List[Dict]], source: Optional[Source] = None) -> None:
+    """
+    Write every account's canonical rows as CSV, one row at a time.
+
+    Dates that parse are written as YYYY-MM-DD and amounts that parse with a
+    dot as the decimal separator, so the file loads the same in any locale.
+    """
+    with _binary(target) as output:
+        text = io.TextIOWrapper(output, encoding='utf-8', newline='')
+        try:
+            writer = csv.writer(text)
+            writer.writerow((ACCOUNT_COLUMN,) + CANONICAL_COLUMNS)
+            for account_index, account in enumerate(accounts, 1):
+                for row in account:
+                    values = [canonical_value(key, row.get(key, "")) for key in CANONICAL_COLUMNS]
+                    writer.writerow([account_index] + ["" if value is None else value for value in values])
+        finally:
+            # Leave a caller's buffer open for it to read
+            text.flush()
+            text.detach()
+
+def _arrow_column(values: List, arrow_type):
+    import pyarrow as pa
+
+    try:
+        return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # A column a parser left as text stays text rather than failing the export
+        return pa.array([None if value is None else str(value) for value in values], type=pa.string())
+
+def write_parquet(target: Target, accounts: List[List[Dict]], source: Optional[Source] = None) -> None:
+    """
+    Write every account's canonical rows as one compressed Parquet table
+    with date, float and text columns
+    """
+    # pyarrow is only needed by this export; importing it costs more than the rest of the app
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    values = {key: [] for key in (ACCOUNT_COLUMN,) + CANONICAL_COLUMNS}
+    for account_index, account in enumerate(accounts, 1):
+        for row in account:
+            values[ACCOUNT_COLUMN].append(account_index)
+            for key in CANONICAL_COLUMNS:
+                value = row.get(key, "")
+                values[key].append(None if _blank(value) else canonical_value(key, value))
+
+    types = {ACCOUNT_COLUMN: pa.int32(), DATE_COLUMN: pa.date32()}
+    types.update((key, pa.float64()) for key in AMOUNT_COLUMNS)
+    table = pa.table({key: _arrow_column(column, types.get(key, pa.string())) for key, column in values.items()})
+    pq.write_table(table, target, compression=PARQUET_COMPRESSION)
+
+def _ofx_transactions(account: List[Dict]) -> Iterator[Tuple[int, date, float, Dict]]:
+    # Balance lines carry no date or no movement and are not transactions
+    unreadable = 0
+    for row_index, row in enumerate(account):
+        posted = parse_date(row.get(DATE_COLUMN, ""))
+        if not isinstance(posted, date):
+            continue
+        debit, credit = parse_amount(row.get("DEBITOS", "")), parse_amount(row.get("CREDITOS", ""))
+        if _number(credit):
+            yield row_index, posted, float(credit), row
+        elif _number(debit):
+            yield row_index, posted, -abs(float(debit)), row
+        elif not (_blank(debit) and _blank(credit)):
+            unreadable += 1
+
+    if unreadable:
+        diagnostics.warning(f"{unreadable} movement(s) with an unreadable amount were left out of the OFX file")
+
+def _ofx_balance(account: List[Dict]) -> Optional[float]:
+    for row in reversed(account):
+        balance = parse_amount(row.get("SALDO", ""))
+        if _number(balance):
+            return float(balance)
+    return None
+
+def _ofx_source(accounts: List[List[Dict]]) -> Source:
+    # Without a conversion to name them, the rows themselves identify the statement
+    rows = repr([[sorted(row.items()) for row in account] for account in accounts])
+    return Source("", hashlib.sha256(rows.encode('utf-8')).hexdigest())
+
+def _ofx_account_id(source: Source, account_index: int) -> str:
+    # Importers file movements by BANKID and ACCTID, so every statement gets
+    # accounts of its own rather than the same ids as every other statement
+    bank = unicodedata.normalize("NFKD", source.bank).encode("ascii", "ignore").decode()
+    bank = re.sub(r"[^A-Z0-9]", "", bank.upper())[:8] or "BANK"
+    return f"{bank}-{source.key[:8]}-{account_index}"[:OFX_ACCOUNT_ID_LENGTH]
+
+def _ofx_transaction_id(source: Source, account_index: int, row_index: int, posted: date, amount: float) -> str:
+    # Importers drop movements whose FITID they have seen, so it must be
+    # unique across statements and the same every time one is exported
+    payload = f"{source.key}:{account_index}:{row_index}:{posted:%Y%m%d}:{amount:.2f}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+def write_ofx(target: Target, accounts: List[List[Dict]], source: Optional[Source] = None) -> None:
+    """
+    Write every account as a bank statement in an OFX 2 document.
+
+    Account and movement ids are derived from the `source` conversion, so
+    re-exporting a statement gives the same ids and another statement never
+    does.
+    """
+    source = source or _ofx_source(accounts)
+    with _binary(target) as output:
+        def emit(line: str) -> None:
+            output.write(line.encode('utf-8') + b"\n")
+
+        emit('<?xml version="1.0" encoding="UTF-8" standalone="no"?>')
+        emit('<?OFX OFXHEADER="200" VERSION="220" SECURITY="NONE" OLDFILEUID="NONE" NEWFILEUID="NONE"?>')
+        emit("<OFX>")
+        emit(f"<SIGNONMSGSRSV1><SONRS><STATUS><CODE>0</CODE><SEVERITY>INFO</SEVERITY></STATUS>"
+             f"<DTSERVER>{date.today():%Y%m%d}</DTSERVER><LANGUAGE>SPA</LANGUAGE></SONRS></SIGNONMSGSRSV1>")
+        emit("<BANKMSGSRSV1>")
+        for account_index, account in enumerate(accounts, 1):
+            transactions = list(_ofx_transactions(account))
+            dates = [posted for _, posted, _, _ in transactions] or [date.today()]
+
+            emit(f"<STMTTRNRS><TRNUID>{account_index}</TRNUID><STATUS><CODE>0</CODE><SEVERITY>INFO</SEVERITY></STATUS>")
+            emit(f"<STMTRS><CURDEF>{OFX_CURRENCY}</CURDEF>")
+            emit(f"<BANKACCTFROM><BANKID>{OFX_BANK_ID}</BANKID><ACCTID>{_ofx_account_id(source, account_index)}</ACCTID>"
+                 f"<ACCTTYPE>CHECKING</ACCTTYPE></BANKACCTFROM>")
+            emit(f"<BANKTRANLIST><DTSTART>{min(dates):%Y%m%d}</DTSTART><DTEND>{max(dates):%Y%m%d}</DTEND>")
+            for row_index, posted, amount, row in transactions:
+                detail = str(row.get("DETALLE", "")).strip()
+                reference = escape(str(row.get("REFERENCIA", "")).strip())
+                emit(f"<STMTTRN><TRNTYPE>{'CREDIT' if amount >= 0 else 'DEBIT'}</TRNTYPE>"
+                     f"<DTPOSTED>{posted:%Y%m%d}</DTPOSTED><TRNAMT>{amount:.2f}</TRNAMT>"
+                     f"<FITID>{_ofx_transaction_id(source, account_index, row_index, posted, amount)}</FITID>"
+                     + (f"<REFNUM>{reference}</REFNUM>" if reference else "")
+                     + f"<NAME>{escape(detail[:OFX_NAME_LENGTH])}</NAME><MEMO>{escape(detail)}</MEMO></STMTTRN>")
+            emit("</BANKTRANLIST>")
+
+            balance = _ofx_balance(account)
+            if balance is not None:
+                emit(f"<LEDGERBAL><BALAMT>{balance:.2f}</BALAMT><DTASOF>{max(dates):%Y%m%d}</DTASOF></LEDGERBAL>")
+            emit("</STMTRS></STMTTRNRS>")
+        emit("</BANKMSGSRSV1>")
+        emit("</OFX>")
+
+class ExportFormat(NamedTuple):
+    label: str
+    extension: str
+    mime: str
+    write: Callable[[Target, List[List[Dict]], Optional[Source]], None]
+
+export_formats = {
+    "xlsx": ExportFormat("Excel", "xlsx", EXCEL_MIME, write_workbook),
+    "csv": ExportFormat("CSV", "csv", "text/csv", write_csv),
+    "parquet": ExportFormat("Parquet", "parquet", "application/vnd.apache.parquet", write_parquet),
+    "ofx": ExportFormat("OFX", "ofx", "application/x-ofx", write_ofx),
+}
+
+def export_bytes(accounts: List[List[Dict]], format_name: str = "xlsx", source: Optional[Source] = None) -> bytes:
+    """
+    A statement exported in the given format as bytes, for downloads
+    """
+    buffer = BytesIO()
+    export_formats[format_name].write(buffer, accounts, source)
+    return buffer.getvalue()
+
+def export_name(file_name: str, format_name: str = "xlsx") -> str:
+    return f"{file_name}.{export_formats[format_name].extension}"
+
+def _unique_name(name: str, taken: set) -> str:
+    # Banks name every statement alike; later copies get " (2)", " (3)", ...
+    stem, dot, extension = name.rpartition('.')
+    if not dot:
+        stem, extension = name, ""
+    candidate = name
+    copy = 1
+    while candidate in taken:
+        copy += 1
+        candidate = f"{stem} ({copy}){dot}{extension}"
+    taken.add(candidate)
+    return candidate
+
+def zip_files(files: Iterable[Tuple[str, bytes]]) -> bytes:
+    """
+    Bundle named files into one zip.
+
+    Files are compressed one at a time into a spooled file as the iterable
+    produces them, so only the finished archive is ever held whole. Repeated
+    names are numbered so no entry overwrites another when unzipped.
+    """
+    taken = set()
+    with SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as spool:
+        with zipfile.ZipFile(spool, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, content in files:
+                archive.writestr(_unique_name(name, taken), content)
+        spool.seek(0)
+        return spool.read()
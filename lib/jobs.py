@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+import uuid
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from lib import diagnostics
+from lib.processes import spawn_context
+
+JOB_WORKERS = int(os.environ.get("CONVERTER_JOB_WORKERS", str(os.cpu_count() or 1)))
+# Finished jobs nobody picked up are dropped after this many seconds
+JOB_TTL = 3600
+
+class Job:
+    """
+    One background call and, once finished, its result or error
+    """
+
+    def __init__(self, job_id: str):
+        self.id = job_id
+        self.status = "queued"
+        self.result: Any = None
+        self.error: Optional[str] = None
+        # Warnings and errors reported while running, as (level, message)
+        self.messages: List[Tuple[str, str]] = []
+        self.submitted = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("done", "failed")
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+class RecordingDiagnostics(diagnostics.Diagnostics):
+    """
+    Keep a job's warnings and errors so the page can show them when it is done
+    """
+
+    def __init__(self, messages: List[Tuple[str, str]]):
+        self.messages = messages
+
+    def warning(self, message: str) -> None:
+        self.messages.append(("warning", message))
+
+    def error(self, message: str) -> None:
+        self.messages.append(("error", message))
+
+def _init_worker() -> None:
+    # Jobs are already spread across processes; extracting a statement's
+    # pages in a nested pool would only oversubscribe the CPUs
+    from lib.api import file
+    file.MAX_WORKERS = 1
+
+def _call(fn: Callable, args: Tuple, kwargs: Dict) -> Tuple[Any, Optional[str], List[Tuple[str, str]]]:
+    # Runs in a worker process; the result, error and what was reported
+    # travel back together, as the page only reads them once the job is done
+    messages = []
+    with diagnostics.use(RecordingDiagnostics(messages)):
+        try:
+            return fn(*args, **kwargs), None, messages
+        except Exception as e:
+            return None, f"{type(e).__name__}: {e}", messages
+
+class JobQueue:
+    """
+    In-process queue running jobs on a bounded pool of worker processes.
+
+    PyMuPDF and the parsers hold the GIL, so jobs only run side by side in
+    processes of their own. A thread per running job waits on its process
+    and keeps the job's status, and jobs belong to the Streamlit server
+    rather than to a session, so a page keeps only the job id and picks the
+    result up on whichever rerun sees the job finished. Functions and their
+    arguments must be picklable.
+    """
+
+    def __init__(self, max_workers: int = JOB_WORKERS):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._processes_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+
+    def submit(self, fn: Callable, *args, **kwargs) -> str:
+        """
+        Queue `fn(*args, **kwargs)` and return the job id
+        """
+        job = Job(uuid.uuid4().hex)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job.id
+
+    def _submit(self, fn: Callable, args: Tuple, kwargs: Dict):
+        with self._processes_lock:
+            if self._processes is None:
+                # Spawned workers do not inherit the Streamlit server's threads
+                self._processes = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=spawn_context(),
+                    initializer=_init_worker
+                )
+            return self._processes, self._processes.submit(_call, fn, args, kwargs)
+
+    def _reset(self, broken: ProcessPoolExecutor) -> None:
+        # A worker died (e.g. killed for memory); the next job starts a fresh pool
+        with self._processes_lock:
+            if self._processes is broken:
+                self._processes = None
+        broken.shutdown(wait=False)
+
+    def _run(self, job: Job, fn: Callable, args: Tuple, kwargs: Dict) -> None:
+        job.started = time.time()
+        job.status = "running"
+        processes = None
+        try:
+            processes, future = self._submit(fn, args, kwargs)
+            job.result, job.error, job.messages = future.result()
+        except BrokenProcessPool as e:
+            if processes is not None:
+                self._reset(processes)
+            job.error = f"{type(e).__name__}: {e}"
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+        finally:
+            job.status = "failed" if job.error else "done"
+            job.finished = time.time()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pop(self, job_id: str) -> Optional[Job]:
+        """
+        Take a job out of the queue once its result has been used
+        """
+        with self._lock:
+            return self._jobs.pop(job_id, None)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - JOB_TTL
+        for job_id in [job.id for job in self._jobs.values() if job.done and job.finished < cutoff]:
+            del self._jobs[job_id]
+
+job_queue = JobQueue()
@@ -1,58 +1,201 @@
-#from lib.api.datalab import parse as datalab_parse
-#rom lib.api.datalab_ocr import parse as datalab_ocr_parse
-from lib.api.file import parse as file_parse
-#from lib.api.file_alt import parse as file_alt_parse
-#from lib.api.file_tables import parse as file_tables_parse
-#from lib.api.file_ocr import parse as file_ocr_parse
-#from lib.api.llamaparse import parse as llama_parse
-
-from lib.parsers.bbva import BBVAParser
-from lib.parsers.bpn import BPNParser
-from lib.parsers.comafi import ComafiParser
-from lib.parsers.credicoop import CredicoopParser
-from lib.parsers.galicia import GaliciaParser
-from lib.parsers.hsbc import HSBCParser
-from lib.parsers.icbc import ICBCParser
-from lib.parsers.macro import MacroParser
-from lib.parsers.nacion import NacionParser
-from lib.parsers.patagonia import PatagoniaParser
-from lib.parsers.roela import RoelaParser
-from lib.parsers.santander import SantanderParser
-from lib.parsers.supervielle import SupervielleParser
-from lib.parsers.mercadopago import MercadoPagoParser
+import importlib
+import inspect
+import re
+import threading
+
+from functools import partial
+from itertools import chain, islice
+
+from lib.api.singleflight import single_flight
+
+# Parsers and extractors are named as "module:attribute" and only imported
+# when a bank is converted, so listing banks imports none of them. Another
+# text extractor: "lib.api.hybrid:parse".
+FILE_PARSE = "lib.api.file:parse"
+FILE_WORDS = "lib.api.file:words"
+# Parsers with `streaming = True` get the generator counterpart of their
+# list extractor, so the statement is never materialised as a list of pages
+STREAMING_EXTRACTORS = {
+    FILE_PARSE: "lib.api.file:iter_pages",
+    FILE_WORDS: "lib.api.file:iter_words"
+}
+
+# Extraction profiles trim each page to the region the bank's parser reads
+# (see lib.api.file.iter_pages). Their markers mirror the parsers' own
+# start/stop checks, so the trimmed text parses exactly like the full text.
+# With `triage` on, pages that cannot hold movements never reach the parser.
+TRIAGE_PROFILE = { "triage": True }
+BPN_PROFILE = {
+    "triage": True,
+    "start": re.compile(r"Saldo Anterior en \$\s*:\s*([-\d.,]+)"),
+    "stop": re.compile(r"Saldo en \$\s*:\s*([-\d.,]+)")
+}
+COMAFI_PROFILE = {
+    "triage": True,
+    # Drops the guarantee and legal notices printed above every page's table
+    "page_start": ("DETALLE DE MOVIMIENTOS", "Saldo al:", "Conceptos")
+}
+CREDICOOP_PROFILE = { "triage": True, "start": "SALDO ANTERIOR" }
+GALICIA_PROFILE = {
+    "triage": True,
+    "start": ("Período de movimientos", "Movimientos"),
+    "stop": "Consolidado de retención de impuestos"
+}
+ROELA_PROFILE = { "triage": True, "start": re.compile(r"^\s*-?\$") }
+SUPERVIELLE_PROFILE = { "triage": True, "start": "Saldo del período anterior" }
 
 parser_map = {
-    "BBVA": (BBVAParser, file_parse, "✅"),
-    "BPN": (BPNParser, file_parse, "✅"),
-    "Comafi": (ComafiParser, file_parse, "✅"),
-    "Credicoop": (CredicoopParser, file_parse, "✅"),
-    "Galicia": (GaliciaParser, file_parse, "✅"),
-    "HSBC": (HSBCParser, file_parse, "✅"),
-    "ICBC": (ICBCParser, file_parse, "✅"),
-    "Macro": (MacroParser, file_parse, "❌"),
-    "Mercado Pago": (MercadoPagoParser, file_parse, "✅"),
-    "Nación": (NacionParser, file_parse, "✅"),
-    "Patagonia": (PatagoniaParser, file_parse, "❌"),
-    "Roela": (RoelaParser, file_parse, "✅"),
-    "Santander": (SantanderParser, file_parse, "✅"),
-    "Supervielle": (SupervielleParser, file_parse, "✅")
+    "BBVA": ("lib.parsers.bbva:BBVAParser", FILE_PARSE, "✅", TRIAGE_PROFILE),
+    "BPN": ("lib.parsers.bpn:BPNParser", FILE_PARSE, "✅", BPN_PROFILE),
+    "Comafi": ("lib.parsers.comafi:ComafiParser", FILE_PARSE, "✅", COMAFI_PROFILE),
+    "Credicoop": ("lib.parsers.credicoop:CredicoopParser", FILE_PARSE, "✅", CREDICOOP_PROFILE),
+    "Galicia": ("lib.parsers.galicia:GaliciaParser", FILE_PARSE, "✅", GALICIA_PROFILE),
+    "HSBC": ("lib.parsers.hsbc:HSBCParser", FILE_PARSE, "✅", TRIAGE_PROFILE),
+    "ICBC": ("lib.parsers.icbc:ICBCParser", FILE_PARSE, "✅", TRIAGE_PROFILE),
+    "Macro": ("lib.parsers.macro:MacroParser", FILE_WORDS, "❌", None),
+    "Mercado Pago": ("lib.parsers.mercadopago:MercadoPagoParser", FILE_PARSE, "✅", TRIAGE_PROFILE),
+    "Nación": ("lib.parsers.nacion:NacionParser", FILE_PARSE, "✅", TRIAGE_PROFILE),
+    "Patagonia": ("lib.parsers.patagonia:PatagoniaParser", FILE_PARSE, "❌", None),
+    "Roela": ("lib.parsers.roela:RoelaParser", FILE_PARSE, "✅", ROELA_PROFILE),
+    "Santander": ("lib.parsers.santander:SantanderParser", FILE_PARSE, "✅", TRIAGE_PROFILE),
+    "Supervielle": ("lib.parsers.supervielle:SupervielleParser", FILE_PARSE, "✅", SUPERVIELLE_PROFILE)
+}
+
+# Banks that print more than one layout. Each variant but the last declares a
+# `fingerprint` pattern; the first one found in the opening pages is used to
+# parse and the last variant is the default.
+variant_map = {
+    "Nación": ("lib.parsers.nacion:NacionParser", "lib.parsers.nacion_alt:NacionParser"),
+    "Santander": ("lib.parsers.santander:SantanderOldParser", "lib.parsers.santander:SantanderParser")
+}
+# Pages read to pick a variant
+FINGERPRINT_PAGES = 3
+
+_prewarm_lock = threading.Lock()
+_prewarm_thread = None
+
+def load(path: str):
+    """
+    Import a "module:attribute" path and return the attribute
+    """
+    module, _, attribute = path.partition(":")
+    return getattr(importlib.import_module(module), attribute)
+
+class VariantParser:
+    """
+    Pick a bank's layout variant from the opening pages, then parse once
+    """
+
+    def __init__(self, variants):
+        self.variants = variants
+        # Cached results are tied to every variant the document could have used
+        self.version = "+".join(variant.version for variant in variants)
+        self.streaming = all(getattr(variant, "streaming", False) for variant in variants)
+
+    def select(self, data):
+        """
+        Return the matching variant and the pages to parse with it.
+
+        Only the first FINGERPRINT_PAGES pages are read; a page stream is
+        handed back with them chained in front, so it is still read once.
+        """
+        if isinstance(data, list):
+            head = data[:FINGERPRINT_PAGES]
+        else:
+            data = iter(data)
+            head = list(islice(data, FINGERPRINT_PAGES))
+            data = chain(head, data)
+
+        text = "\n".join(head)
+        for variant in self.variants[:-1]:
+            lines = getattr(variant, "fingerprint_lines", None)
+            sample = text if lines is None else "\n".join(text.split("\n")[:lines])
+            if variant.fingerprint.search(sample):
+                return variant(), data
+        return self.variants[-1](), data
+
+    def parse(self, data):
+        parser, data = self.select(data)
+        return parser.parse(data)
+
+# First-page fingerprints per bank: the bank's own name, then the headers
+# its parser keys on as (pattern, weight). Matching ignores case.
+BANK_FINGERPRINTS = {
+    "BBVA": (r"\bBBVA\b", ((r"Movimientos en cuentas", 1),)),
+    "BPN": (r"Banco Provincia del Neuqu[eé]n|\bBPN\b", ((r"Saldo Anterior en \$", 2),)),
+    "Comafi": (r"\bComafi\b", ((r"DETALLE DE MOVIMIENTOS", 1), (r"RESUMEN DE OPERACIONES", 1))),
+    "Credicoop": (r"Credicoop", ((r"FECHA\s+COMBTE\s+DESCRIPCION", 2),)),
+    "Galicia": (r"Banco Galicia|\bGalicia\b", ((r"Per[ií]odo de movimientos", 1),)),
+    "HSBC": (r"\bHSBC\b", ((r"EXTRACTO DEL \d{2}/\d{2}/\d{4} AL", 2),)),
+    "ICBC": (r"\bICBC\b", ((r"PERIODO\s+\d{2}-\d{2}-\d{4}", 1),)),
+    "Macro": (r"Banco Macro", ((r"SALDO FINAL AL DIA", 1),)),
+    "Mercado Pago": (r"Mercado\s?Pago", ((r"Saldo inicial:", 1),)),
+    "Nación": (r"Banco de la Naci[oó]n", ((r"SALDO ANTERIOR", 1), (r"SALDO FINAL", 1))),
+    # No header is known for Patagonia's layout, so it is never certain
+    "Patagonia": (r"Banco Patagonia", ()),
+    "Roela": (r"\bRoela\b", ((r"(?m:^\s*Saldo al )", 1),)),
+    "Santander": (r"Santander", ((r"Saldo Inicial", 1), (r"Saldo total", 1))),
+    "Supervielle": (r"Supervielle", ((r"Saldo del per[ií]odo anterior", 2),))
 }
+NAME_WEIGHT = 3
+# A name alone may be the other side of a transfer and a header alone may be
+# shared by several banks, so a bank is only certain with both on the page
+UNCONFIRMED_SCALE = 0.5
+CERTAIN_CONFIDENCE = 0.9
+
+def _compile_fingerprints():
+    # One alternation with a named group per pattern, so a single finditer
+    # pass over the page scores every bank at once
+    groups = {}
+    alternatives = []
+    for bank, (name, headers) in BANK_FINGERPRINTS.items():
+        for pattern, weight, is_name in [(name, NAME_WEIGHT, True)] + [(pattern, weight, False) for pattern, weight in headers]:
+            group = f"f{len(groups)}"
+            groups[group] = (bank, weight, is_name)
+            alternatives.append(f"(?P<{group}>{pattern})")
+    return re.compile("|".join(alternatives), re.IGNORECASE), groups
+
+_fingerprint_regex, _fingerprint_groups = _compile_fingerprints()
 
 class BankParser:
     @staticmethod
     def get_parser(bank_name: str):
-        if bank_name in parser_map:
-            return parser_map[bank_name][0]()
+        if bank_name in variant_map:
+            return VariantParser([load(path) for path in variant_map[bank_name]])
+        elif bank_name in parser_map:
+            return load(parser_map[bank_name][0])()
         else:
             raise ValueError(f"No parser found for bank: {bank_name}")
 
     @staticmethod
-    def get_parser_api(bank_name: str):
+    def get_parser_api(bank_name: str, use_cache: bool = True):
+        # The extractor comes bound to the bank's extraction profile, and
+        # identical uploads being converted at once share one extraction
+        path, profile = BankParser.get_extraction(bank_name)
+        parser_api = load(path)
+        options = {"profile": profile} if profile else {}
+        if not use_cache and "cache" in inspect.signature(parser_api).parameters:
+            # Only the local text extractors keep a page cache
+            options["cache"] = None
+        extractor = partial(parser_api, **options) if options else parser_api
+        return single_flight.wrap(bank_name, extractor)
+
+    @staticmethod
+    def get_extraction(bank_name: str):
+        """
+        The bank's extractor path and extraction profile.
+
+        Parsers that declare `streaming = True` are given the generator
+        counterpart of the extractor in parser_map (see STREAMING_EXTRACTORS).
+        """
         if bank_name in parser_map:
-            return parser_map[bank_name][1]
+            _, path, _, profile = parser_map[bank_name]
+            if getattr(BankParser.get_parser(bank_name), "streaming", False):
+                path = STREAMING_EXTRACTORS.get(path, path)
+            return path, profile
         else:
             raise ValueError(f"No parser API found for bank: {bank_name}")
-    
+
     @staticmethod
     def get_parser_status(bank_name: str):
         if bank_name in parser_map:
@@ -60,6 +203,59 @@ class BankParser:
         else:
             raise ValueError(f"No parser status found for bank: {bank_name}")
 
+    @staticmethod
+    def detect_bank(text: str):
+        """
+        Guess the bank from the text of a statement's first page.
+
+        Returns the bank name and a confidence between 0 and 1, or (None, 0.0)
+        when nothing matches. The confidence is the bank's share of the
+        fingerprint weight of the banks whose name and header were both
+        found; when there are none, its share of all the weight found scaled
+        by UNCONFIRMED_SCALE.
+        """
+        matched = {}
+        for match in _fingerprint_regex.finditer(text):
+            matched[match.lastgroup] = _fingerprint_groups[match.lastgroup]
+
+        # Each fingerprint counts once however often it repeats
+        scores = {}
+        found = {}
+        for bank, weight, is_name in matched.values():
+            scores[bank] = scores.get(bank, 0) + weight
+            found.setdefault(bank, set()).add(is_name)
+        if not scores:
+            return None, 0.0
+
+        # Banks seen by name alone, e.g. in a transfer's detail, do not compete
+        # with one whose name and header are both on the page
+        confirmed = [bank for bank in scores if found[bank] == {True, False}]
+        if confirmed:
+            bank = max(confirmed, key=scores.get)
+            return bank, scores[bank] / sum(scores[other] for other in confirmed)
+
+        bank = max(scores, key=scores.get)
+        return bank, scores[bank] / sum(scores.values()) * UNCONFIRMED_SCALE
+
+    @staticmethod
+    def prewarm():
+        """
+        Import every parser and extractor on a background thread, once per
+        process, so the first conversion does not wait on imports
+        """
+        global _prewarm_thread
+        with _prewarm_lock:
+            if _prewarm_thread is None:
+                paths = [path for entry in parser_map.values() for path in entry[:2]]
+                paths += [path for variants in variant_map.values() for path in variants]
+                _prewarm_thread = threading.Thread(
+                    target=lambda: [load(path) for path in dict.fromkeys(paths)],
+                    name="parser-prewarm",
+                    daemon=True
+                )
+                _prewarm_thread.start()
+        return _prewarm_thread
+
     @staticmethod
     def bank_names():
         return list(parser_map.keys())
@@ -1,5 +1,4 @@
 import re
-import streamlit as st
 from typing import List, Dict
 from datetime import datetime
 
@@ -21,6 +20,8 @@ def convert_to_canonical_format(data: Dict) -> Dict:
     return canonical_rows
 
 class BBVAParser:
+    version = "1"
+
     # Define date_regex as a class variable
     date_regex = re.compile(r'^(\d{2}/\d{2})(/\d{4})?$')
 
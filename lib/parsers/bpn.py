@@ -1,7 +1,8 @@
-import streamlit as st
-from typing import List, Dict
+from typing import Dict, Iterable, List
 import re
 
+from lib.parsers.stream import iter_lines
+
 def convert_to_canonical_format(data: Dict) -> Dict:
     canonical_rows = []
 
@@ -27,16 +28,15 @@ def convert_to_canonical_format(data: Dict) -> Dict:
     return canonical_rows
 
 class BPNParser:
-    def parse(self, data: List[str]) -> List[List[Dict[str, str]]]:
+    version = "1"
+    streaming = True
+
+    def parse(self, data: Iterable[str]) -> List[List[Dict[str, str]]]:
         transactions = []
         saldo_anterior = None
         saldo_actual = None
         parsing = False  # Flag to start parsing after "Saldo Anterior en $"
 
-        # Concatenate all pages into one list of lines
-        all_text = "\n".join(data)
-        lines = all_text.split("\n")
-
         # Regular expressions for matching
         saldo_anterior_regex = re.compile(r"Saldo Anterior en \$\s*:\s*([-\d.,]+)")
         saldo_final_regex = re.compile(r"Saldo en \$\s*:\s*([-\d.,]+)")
@@ -49,7 +49,7 @@ class BPNParser:
             r"(?P<Saldo>[-.\d,]+)$"
         )
 
-        for line in lines:
+        for line in iter_lines(data):
             line = line.strip()
 
             # Check for start of parsing
@@ -1,4 +1,4 @@
-from typing import List, Dict, Tuple
+from typing import Dict, Iterable, List, Tuple
 import re
 
 def convert_to_canonical_format(data: Dict) -> Dict:
@@ -22,6 +22,9 @@ def convert_to_canonical_format(data: Dict) -> Dict:
     return canonical_rows
 
 class ComafiParser:
+    version = "1"
+    streaming = True
+
     def __init__(self):
         # Configurable offsets (in characters)
         self.offset_fecha_start = -1
@@ -42,7 +45,7 @@ class ComafiParser:
         self.offset_saldo_start = -9
         self.offset_saldo_end = 2
 
-    def parse(self, data: List[str]) -> List[List[Dict[str, str]]]:
+    def parse(self, data: Iterable[str]) -> List[List[Dict[str, str]]]:
         transactions_per_account = []
         current_account_transactions = []
         in_movements_section = False
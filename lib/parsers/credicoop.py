@@ -19,6 +19,8 @@ def convert_to_canonical_format(data: Dict) -> Dict:
     return canonical_rows
 
 class CredicoopParser:
+    version = "1"
+
     # Configurable field positions (start and end indices)
     FIELD_CONFIG = {
         "FECHA": (0, 9),       # Adjusted to capture 'dd/mm/aa'
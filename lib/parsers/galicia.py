@@ -20,6 +20,8 @@ def convert_to_canonical_format(data: Dict) -> Dict:
     return canonical_rows
 
 class GaliciaParser:
+    version = "1"
+
     def parse(self, data: List[str]) -> List[List[Dict[str, str]]]:
         """
         Parses the provided bank statement data and extracts transaction details.
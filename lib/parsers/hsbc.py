@@ -1,5 +1,4 @@
 import re
-import streamlit as st
 from typing import List, Dict
 
 def convert_to_canonical_format(data: Dict) -> Dict:
@@ -20,8 +19,9 @@ def convert_to_canonical_format(data: Dict) -> Dict:
     return canonical_rows
 
 class HSBCParser:
+    version = "1"
+
     def parse(self, data: List[str]) -> List[List[Dict[str, str]]]:
-        st.write(data)
         records = []
         current_date = ""
         previous_saldo = None
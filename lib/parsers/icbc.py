@@ -24,6 +24,8 @@ def convert_to_canonical_format(data: Dict) -> Dict:
     return canonical_rows
 
 class ICBCParser:
+    version = "1"
+
     def parse(self, data: List[str]) -> List[Dict[str, str]]:
         accounts = []
         rows = []
@@ -1,5 +1,6 @@
 import re
-from typing import Dict, List, Optional
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional
 from decimal import Decimal
 
 def convert_to_canonical_format(data: Dict) -> Dict:
@@ -23,10 +24,19 @@ def convert_to_canonical_format(data: Dict) -> Dict:
 
 
 class MercadoPagoParser:
+    version = "1"
+    streaming = True
+
+    # Transactions start at a DD-MM-YYYY date and run until the next one
+    date_regex = re.compile(r'\d{2}-\d{2}-\d{2}\d{2}')
+    currency_regex = re.compile(r'\$\s*-?\d+(?:(?:\.\d{3})*,\d{2}|,\d{2})')
+    initial_balance_regex = re.compile(r'Saldo inicial:\s*' + currency_regex.pattern)
+    # The description ends where the first 8-digit run (the ID) begins
+    description_end_regex = re.compile(r'\d{8}')
+    id_regex = re.compile(r'\d{11}')
+
     def __init__(self):
         self.current_balance = Decimal('0')
-        self.date_pattern = r'\d{2}-\d{2}-\d{2}\d{2}'
-        self.currency_pattern = r'\$\s*-?\d+(?:(?:\.\d{3})*,\d{2}|,\d{2})'
 
     def _parse_currency(self, value: str) -> str:
         """Convert currency format '$ 1.234,56' or '$ -1.234,56' to '1.234,56' or '-1.234,56'"""
@@ -43,86 +53,54 @@ class MercadoPagoParser:
 
     def _find_initial_balance(self, text: str) -> Optional[str]:
         """Find the initial balance in the text"""
-        match = re.search(r'Saldo inicial:\s*' + self.currency_pattern, text)
+        match = self.initial_balance_regex.search(text)
         if match:
             balance = self._parse_currency(match.group().split(':')[1])
             self.current_balance = Decimal(balance.replace('.', '').replace(',', '.'))
             return balance
         return None
 
-    def _extract_description(self, text: str, start_idx: int, end_idx: int) -> str:
-        """Extract description from transaction text, handling multiline descriptions"""
-        # Get the text segment we're working with
-        segment = text[start_idx:end_idx]
-
-        # Split into lines and remove empty ones
-        lines = [line.strip() for line in segment.split('\n') if line.strip()]
-
-        # Find the line with the ID (8 digits)
-        id_pattern = r'\d{8}'
-        description_lines = []
-
-        for i, line in enumerate(lines):
-            line = re.sub(r'^\d{2}-\d{2}-\d{4}\s*', '', line)
-            # If line contains ID pattern, keep the text before it
-            if re.search(id_pattern, line):
-                # Split the line at the ID pattern and keep the text before it
-                pre_id_text = re.split(id_pattern, line)[0].strip()
-                if pre_id_text:
-                    description_lines.append(pre_id_text)
-                break
-
-            description_lines.append(line)
-
-        return ' '.join(description_lines).strip()
+    def _extract_transaction(self, text: str, date_match: re.Match, end: int) -> Optional[Dict[str, str]]:
+        """Extract the transaction between a date and the next one (or `end`)"""
+        start = date_match.start()
 
-    def _extract_transaction(self, text: str, start_idx: int) -> tuple[Optional[Dict[str, str]], int]:
-        """Extract a single transaction starting from the given index"""
-        # Find next date
-        date_match = re.search(self.date_pattern, text[start_idx:])
-        if not date_match:
-            return None, len(text)
+        # Searching by position keeps the page in one piece; only the
+        # description itself is ever copied out
+        description_end = self.description_end_regex.search(text, date_match.end(), end)
+        description_text = text[date_match.end():description_end.start() if description_end else end]
+        description = ' '.join(line.strip() for line in description_text.split('\n') if line.strip())
 
-        transaction_start = start_idx + date_match.start()
+        id_match = self.id_regex.search(text, start, end)
 
-        # Find next date to determine transaction end
-        next_date_match = re.search(self.date_pattern, text[transaction_start + 10:])
-        transaction_end = transaction_start + 10 + next_date_match.start() if next_date_match else len(text)
+        # The amount and the balance are the last two currency values
+        currency_matches = self.currency_regex.finditer(text, start, end)
+        last_two = deque(currency_matches, maxlen=2)
+        if len(last_two) < 2:
+            return None
 
-        transaction_text = text[transaction_start:transaction_end]
+        valor, saldo = (self._parse_currency(match.group()) for match in last_two)
 
-        # Extract required fields
-        date = date_match.group().replace('-', '/')
+        # Validate balance
+        #self._validate_balance(valor, saldo)
 
-        # Extract description using the new method
-        description = self._extract_description(text, transaction_start, transaction_end)
-
-        # Find ID (numeric sequence)
-        id_match = re.search(r'\d{11}', transaction_text)
-        id_value = id_match.group() if id_match else ""
-
-        # Find currency values (should be last two numbers in transaction)
-        currency_matches = re.finditer(self.currency_pattern, transaction_text)
-        currency_values = [self._parse_currency(m.group()) for m in currency_matches]
-
-        if len(currency_values) >= 2:
-            valor = currency_values[-2]
-            saldo = currency_values[-1]
-
-            # Validate balance
-            #self._validate_balance(valor, saldo)
-
-            return {
-                "Fecha": date,
-                "Descripción": description,
-                "ID": id_value,
-                "Valor": valor,
-                "Saldo": saldo
-            }, transaction_start + 10
+        return {
+            "Fecha": date_match.group().replace('-', '/'),
+            "Descripción": description,
+            "ID": id_match.group() if id_match else "",
+            "Valor": valor,
+            "Saldo": saldo
+        }
 
-        return None, transaction_start + 10
+    def _scan_page(self, page: str, pos: int) -> Iterator[Dict[str, str]]:
+        """Yield the page's transactions in a single pass over its date boundaries"""
+        dates = list(self.date_regex.finditer(page, pos))
+        for index, date_match in enumerate(dates):
+            end = dates[index + 1].start() if index + 1 < len(dates) else len(page)
+            transaction = self._extract_transaction(page, date_match, end)
+            if transaction:
+                yield transaction
 
-    def parse(self, data: List[str]) -> List[List[Dict[str, str]]]:
+    def parse(self, data: Iterable[str]) -> List[List[Dict[str, str]]]:
         result = []
 
         for page in data:
@@ -141,9 +119,9 @@ class MercadoPagoParser:
                     })
 
             # Skip header section - find "DETALLE DE MOVIMIENTOS" first
-            header_end_match = re.search(r'DETALLE DE MOVIMIENTOS', page)
-            if header_end_match:
-                current_pos = header_end_match.end()
+            header_start = page.find('DETALLE DE MOVIMIENTOS')
+            if header_start != -1:
+                current_pos = header_start + len('DETALLE DE MOVIMIENTOS')
 
                 # Skip the column headers (Fecha, Descripción, ID, etc.)
                 column_headers_end = page.find('\n', current_pos)
@@ -153,11 +131,7 @@ class MercadoPagoParser:
                 current_pos = 0
 
             # Process transactions
-            while current_pos < len(page):
-                transaction, next_pos = self._extract_transaction(page, current_pos)
-                if transaction:
-                    page_transactions.append(transaction)
-                current_pos = next_pos
+            page_transactions.extend(self._scan_page(page, current_pos))
 
             if page_transactions:
                 result.append(page_transactions)
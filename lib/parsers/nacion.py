@@ -1,6 +1,4 @@
-import streamlit as st
 from typing import Dict, List
-from lib.parsers.nacion_alt import NacionParser as NacionParserAlt
 import re
 
 def convert_to_canonical_format(data: List[Dict[str, str]]) -> List[Dict[str, str]]:
@@ -34,6 +32,11 @@ def convert_to_canonical_format(data: List[Dict[str, str]]) -> List[Dict[str, st
     return canonical_rows
 
 class NacionParser:
+    version = "1"
+    # Prints SALDO ANTERIOR on a line of its own; the alternate layout
+    # (nacion_alt) puts the amount on the same line
+    fingerprint = re.compile(r"^\s*SALDO ANTERIOR\s*$", re.IGNORECASE | re.MULTILINE)
+
     def parse(self, data: List[str]) -> List[List[Dict[str, str]]]:
         text = "\n".join(data)
         lines = text.split("\n")
@@ -133,10 +136,7 @@ class NacionParser:
             records.append(record)
             previous_saldo = current_saldo
 
-        if records:
-            return [convert_to_canonical_format(records)]
-        else:
-            return NacionParserAlt().parse(data)
+        return [convert_to_canonical_format(records)] if records else []
 
     def _convert_currency(self, value: str) -> float:
         """
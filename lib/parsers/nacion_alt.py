@@ -1,4 +1,3 @@
-import streamlit as st
 from typing import Dict, List
 import re
 
@@ -33,6 +32,8 @@ def convert_to_canonical_format(data: List[Dict[str, str]]) -> List[Dict[str, st
     return canonical_rows
 
 class NacionParser:
+    version = "1"
+
     def parse(self, data: List[str]) -> List[List[Dict[str, str]]]:
         text = "\n".join(data)
         lines = text.split("\n")
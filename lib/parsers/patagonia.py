@@ -1,7 +1,10 @@
-import streamlit as st
 from typing import Dict, List
 
+from lib import diagnostics
+
 class PatagoniaParser:
+    version = "1"
+
     def parse(self, data: List[Dict]) -> List[Dict]:
         # Define the desired output fields
         fields = ["FECHA", "CONCEPTO", "REFER.", "FECHA VALOR", "DEBITOS", "CREDITOS", "SALDO"]
@@ -108,7 +111,7 @@ class PatagoniaParser:
                 output.append(entry)
         
         # Optionally, display the raw data for debugging purposes
-        st.write("Processed Data:", output)
+        diagnostics.write("Processed Data:", output)
         
         return output
 
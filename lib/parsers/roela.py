@@ -36,6 +36,8 @@ def is_saldo_line(line: str) -> bool:
     return line.strip().lower().startswith('saldo al ')
 
 class RoelaParser:
+    version = "1"
+
     def parse(self, data: List[str]) -> List[List[Dict[str, str]]]:
         # Combine all data strings into a single list of lines
         lines = []
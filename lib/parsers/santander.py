@@ -1,6 +1,8 @@
 import re
 from typing import Dict, List
 
+from lib import diagnostics
+
 def convert_to_canonical_format(data: Dict) -> Dict:
     canonical_rows = []
 
@@ -19,29 +21,10 @@ def convert_to_canonical_format(data: Dict) -> Dict:
     return canonical_rows
 
 class SantanderParser:
-    def detect_format(self, data: List[str]) -> str:
-        """Detect if it's old format (pesos) or new format ($) by checking first 100 lines"""
-        # Join first few pages to get enough content for detection
-        first_pages = data[:3] if len(data) > 3 else data
-        text = '\n'.join(first_pages)
-        lines = text.split('\n')[:100]  # Check first 100 lines
-
-        # Look for "pesos" followed by a number pattern
-        pesos_pattern = re.compile(r'pesos\s+[\d.,]+')
-
-        for line in lines:
-            if pesos_pattern.search(line.lower()):
-                return "old"
-
-        return "new"
+    version = "1"
 
     def parse(self, data: List[str]) -> List[List[Dict[str, str]]]:
-        format_type = self.detect_format(data)
-
-        if format_type == "old":
-            return self.parse_old_format(data)
-        else:
-            return self.parse_new_format(data)
+        return self.parse_new_format(data)
 
     def parse_old_format(self, data: List[str]) -> List[List[Dict[str, str]]]:
         """Parse old format with 'pesos' indicators"""
@@ -341,7 +324,7 @@ class SantanderParser:
             result = float(amount_str)
             return result
         except ValueError:
-            st.write(f"Failed to parse '{original}' (cleaned: '{amount_str}')")
+            diagnostics.write(f"Failed to parse '{original}' (cleaned: '{amount_str}')")
             return None
 
     def format_amount(self, amount):
@@ -402,3 +385,13 @@ class SantanderParser:
                         lines.append(line_stripped)
 
         return '\n'.join(lines)
+
+class SantanderOldParser(SantanderParser):
+    """Old format, which writes amounts as 'pesos 1.234,56' instead of '$ 1.234,56'"""
+    version = "1"
+    fingerprint = re.compile(r'pesos\s+[\d.,]+', re.IGNORECASE)
+    # Only the statement header is checked, as the old detection did
+    fingerprint_lines = 100
+
+    def parse(self, data: List[str]) -> List[List[Dict[str, str]]]:
+        return self.parse_old_format(data)
@@ -0,0 +1,12 @@
+from typing import Iterable, Iterator
+
+def iter_lines(pages: Iterable[str]) -> Iterator[str]:
+    """
+    Yield the lines of each page in turn without joining the pages.
+
+    Parsers that set `streaming = True` promise to read their input once, in
+    order, through a plain iteration like this one, so they can be fed the
+    page generator from `lib.api.file.iter_pages` instead of a list.
+    """
+    for page in pages:
+        yield from page.split('\n')
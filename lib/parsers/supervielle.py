@@ -25,6 +25,8 @@ def convert_to_canonical_format(data: Dict) -> Dict:
     return canonical_rows
 
 class SupervielleParser:
+    version = "1"
+
     def parse_currency(self, s: str) -> float:
         """
         Converts a Spanish-formatted currency string to a float.
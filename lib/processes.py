@@ -0,0 +1,32 @@
+import sys
+import types
+
+from multiprocessing.context import SpawnContext, SpawnProcess
+
+class _Process(SpawnProcess):
+    """
+    A spawned process that does not re-run the parent's main script.
+
+    Spawned children import the parent's __main__ module so pickled
+    references to it resolve. Under Streamlit that module is the app script,
+    which would then run again, without a session, in every worker. Nothing
+    the app sends to its workers lives in __main__, so they start without it.
+    """
+
+    @staticmethod
+    def _Popen(process_obj):
+        main = sys.modules["__main__"]
+        sys.modules["__main__"] = types.ModuleType("__main__")
+        try:
+            return SpawnProcess._Popen(process_obj)
+        finally:
+            sys.modules["__main__"] = main
+
+class _Context(SpawnContext):
+    Process = _Process
+
+def spawn_context() -> SpawnContext:
+    """
+    Multiprocessing context for the app's worker pools; see `_Process`
+    """
+    return _Context()
@@ -0,0 +1,49 @@
+import time
+
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+class Timings:
+    """
+    Seconds spent in each named stage of one conversion.
+
+    Spans are exclusive: time spent in a span opened inside another is only
+    counted for the inner one, so the stages add up to the wall time. A
+    stage entered more than once accumulates.
+    """
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+        # Time taken by nested spans, one entry per open span
+        self._nested = [0.0]
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        self._nested.append(0.0)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = self._nested.pop()
+            self._nested[-1] += elapsed
+            self.seconds[name] = self.seconds.get(name, 0.0) + elapsed - nested
+
+    def iterate(self, name: str, iterable: Iterable[T]) -> Iterator[T]:
+        """
+        Count the time spent producing each item of a lazy iterable under `name`,
+        however its consumer interleaves the work
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.span(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def as_dict(self) -> Dict[str, float]:
+        return {name: round(seconds, 4) for name, seconds in self.seconds.items()}
@@ -74,13 +74,17 @@ if st.session_state.logged_in and st.session_state.username == "admin":
 
     if results:
         # Create DataFrame with parsed JSON stats
+        usages = [(row[0], row[1], json.loads(row[2])) for row in results]
         df = pd.DataFrame([
             {
-                'User': row[0],
-                'Timestamp': row[1],
-                'Bank': json.loads(row[2]).get('bank', ''),
-                'Pages': json.loads(row[2]).get('pages', 0)
-            } for row in results
+                'User': user_name,
+                'Timestamp': timestamp,
+                'Bank': stats.get('bank', ''),
+                'Pages': stats.get('pages', 0),
+                'Size (KB)': round(stats.get('bytes', 0) / 1024),
+                'Rows': stats.get('rows', 0),
+                'Seconds': round(sum(stats.get('timings', {}).values()), 2)
+            } for user_name, timestamp, stats in usages
         ])
 
         # Display metrics
@@ -1,70 +1,212 @@
 import streamlit as st
-import pandas as pd
 
-from lib.parsers.base import BankParser
-from lib.api.file import stats
-from lib.data.usage import usage_tracker
-from io import BytesIO
-
-
-if st.session_state.logged_in:
-    st.title("PDF Transformer")
+from typing import NamedTuple, Optional
 
-    selected_bank = st.selectbox(
-        "Select a bank",
-        BankParser.bank_names(),
-        key="bank_select"
+from lib import diagnostics
+from lib.converter import convert
+from lib.export import Source, export_bytes, export_formats, export_name, zip_files
+from lib.jobs import job_queue
+from lib.parsers.base import BankParser, CERTAIN_CONFIDENCE
+from lib.api.file import first_page_text
+from lib.data.usage import usage_tracker
+from lib.timing import Timings
+
+# Exported files kept across reruns and sessions
+EXPORT_CACHE_ENTRIES = 64
+
+class Statement(NamedTuple):
+    """
+    A converted upload and what is needed to export it and time the export
+    """
+    file_name: str
+    accounts: list
+    result_key: str
+    usage_id: Optional[int]
+    stats: dict
+    timings: Timings
+
+@st.cache_data(max_entries=EXPORT_CACHE_ENTRIES, show_spinner=False)
+def cached_export(result_key: str, format_name: str, bank: str, _accounts: list) -> bytes:
+    # The rows are not hashed; the conversion's result key already identifies them
+    return export_bytes(_accounts, format_name, Source(bank, result_key))
+
+@st.cache_data(max_entries=EXPORT_CACHE_ENTRIES, show_spinner=False)
+def cached_zip(result_keys: tuple, file_names: tuple, format_name: str, _statements: list) -> bytes:
+    return zip_files(
+        (export_name(statement.file_name, format_name), cached_export(statement.result_key, format_name, statement.stats['bank'], statement.accounts))
+        for statement in _statements
     )
 
-    uploaded_file = st.file_uploader("Upload your PDF", type=['pdf'])
-
-    st.write(f"{selected_bank} status: {BankParser.get_parser_status(selected_bank)}")
-
-    if uploaded_file is not None:
-        st.write("File uploaded successfully!")
+@st.fragment(run_every=1.0)
+def jobs_progress(jobs: dict):
+    finished = 0
+    for file_name, job_id, _ in jobs.values():
+        job = job_queue.get(job_id)
+        if job is None or job.done:
+            finished += 1
+            st.write(f"{file_name}: done")
+        elif job.status == "running":
+            st.write(f"{file_name}: processing ({job.elapsed:.0f}s)")
+        else:
+            st.write(f"{file_name}: queued")
+
+    st.progress(finished / len(jobs), text=f"Processed {finished} of {len(jobs)} PDFs")
+    if finished == len(jobs):
+        # Rerun the whole page so it picks the results up
+        st.rerun()
+
+def collect_results(jobs: dict) -> dict:
+    page_diagnostics = diagnostics.StreamlitDiagnostics()
+    results = {}
+    for file_id, (file_name, job_id, timings) in jobs.items():
+        job = job_queue.pop(job_id)
+        if job is None:
+            st.error(f"{file_name}: the conversion was lost, please process it again")
+            continue
+
+        # What the core reported in the job's worker is replayed on the page now
+        for level, message in job.messages:
+            getattr(page_diagnostics, level)(f"{file_name}: {message}")
+
+        conversion = job.result
+        if job.error:
+            st.error(f"{file_name}: Error processing the PDF: {job.error}")
+        elif conversion.accounts:
+            # The job timed its stages on a copy in its worker process
+            timings.seconds.update(conversion.stats['timings'])
+            with timings.span("db_write"):
+                usage_id = usage_tracker.record_conversion(conversion.stats)
+            results[file_id] = Statement(
+                file_name.rsplit('.', 1)[0], conversion.accounts, conversion.key, usage_id, conversion.stats, timings
+            )
+        elif conversion.extracted:
+            st.error(f"{file_name}: Error parsing the data")
+        else:
+            st.error(f"{file_name}: Error processing the PDF")
+
+    if results:
+        st.success(f"{len(results)} of {len(jobs)} PDFs processed successfully!")
+    return results
 
-        if st.button("Process PDF"):
-            st.session_state.processed_data = None
 
-            with st.spinner("Processing PDF..."):
-                parser = BankParser.get_parser_api(selected_bank)
-                bytes_data = uploaded_file.read()
-                data = parser(bytes_data)
-
-                if data:
-                    parser = BankParser.get_parser(selected_bank)
-                    parsed_data = parser.parse(data)
-                    #st.write(parsed_data)
-
-                    if parsed_data:
-                        file_stats = stats(bytes_data)
-                        file_stats['bank'] = selected_bank
-                        usage_tracker.record_conversion(file_stats)
-                        st.success("PDF processed successfully!")
-                        st.session_state.processed_data = parsed_data
-                    else:
-                        st.error("Error parsing the data")
-                        st.session_state.processed_data = None
-                else:
-                    st.error("Error processing the PDF")
-                    st.session_state.processed_data = None
-
-    # Display download buttons if data has been processed
-    if 'processed_data' in st.session_state and st.session_state.processed_data:
-        file_name = uploaded_file.name.rsplit('.', 1)[0]
-
-        for account_index, account_data in enumerate(st.session_state.processed_data, 1):
-            st.subheader(f"Account {account_index}")
+if st.session_state.logged_in:
+    # Parsers load on first use; start importing them while the user uploads
+    BankParser.prewarm()
 
-            df = pd.DataFrame(account_data)
+    st.title("PDF Transformer")
 
-            excel_buffer = BytesIO()
-            df.to_excel(excel_buffer, index=False, engine='openpyxl')
-            excel_buffer.seek(0)
+    uploaded_files = st.file_uploader("Upload your PDFs", type=['pdf'], accept_multiple_files=True)
+
+    # The first page usually names the bank; only ask when it is not certain
+    detections = st.session_state.setdefault("detections", {})
+    bank_names = BankParser.bank_names()
+    banks = {}
+    for uploaded_file in uploaded_files:
+        if uploaded_file.file_id not in detections:
+            text = first_page_text(uploaded_file.getvalue())
+            # Only an unreadable upload is skipped; the others can still be processed
+            detections[uploaded_file.file_id] = None if text is None else BankParser.detect_bank(text)
+
+        detection = detections[uploaded_file.file_id]
+        if detection is None:
+            st.error(f"{uploaded_file.name}: the file is not a readable PDF (damaged or password protected) and will be skipped")
+            continue
+
+        detected_bank, confidence = detection
+        if detected_bank and confidence >= CERTAIN_CONFIDENCE:
+            bank = detected_bank
+            st.write(f"{uploaded_file.name}: detected bank {bank}")
+        else:
+            bank = st.selectbox(
+                f"Bank of {uploaded_file.name}",
+                bank_names,
+                index=bank_names.index(detected_bank) if detected_bank else 0,
+                key=f"bank_{uploaded_file.file_id}"
+            )
+            st.warning("The bank could not be detected with certainty, please check it")
+        st.write(f"Status: {BankParser.get_parser_status(bank)}")
+        banks[uploaded_file.file_id] = bank
+
+    jobs = st.session_state.get("jobs")
+    if banks:
+        if st.button("Process PDFs", disabled=bool(jobs)):
+            st.session_state.processed = None
+            st.session_state.exports_ready = False
+            # Every file runs as a background job; the page only keeps their ids
+            jobs = {}
+            for uploaded_file in uploaded_files:
+                if uploaded_file.file_id not in banks:
+                    continue
+                timings = Timings()
+                with timings.span("read"):
+                    data = uploaded_file.getvalue()
+                job_id = job_queue.submit(convert, data, banks[uploaded_file.file_id], timings=timings)
+                jobs[uploaded_file.file_id] = (uploaded_file.name, job_id, timings)
+            st.session_state.jobs = jobs
+
+    if jobs:
+        pending = [job_queue.get(job_id) for _, job_id, _ in jobs.values()]
+        if all(job is None or job.done for job in pending):
+            st.session_state.jobs = None
+            st.session_state.processed = collect_results(jobs)
+        else:
+            jobs_progress(jobs)
+
+    # Exports are only built once asked for, then served from the cache on every rerun
+    processed = st.session_state.get("processed")
+    if processed:
+        format_name = st.selectbox(
+            "Export format",
+            list(export_formats),
+            format_func=lambda name: export_formats[name].label,
+            key="export_format"
+        )
+        export_format = export_formats[format_name]
+
+        prepared_now = False
+        if not st.session_state.get("exports_ready"):
+            if st.button("Prepare downloads"):
+                st.session_state.exports_ready = prepared_now = True
+
+    if processed and st.session_state.get("exports_ready"):
+        exports = {}
+        # Exports run on the page, so what they report is shown right away
+        with diagnostics.use(diagnostics.StreamlitDiagnostics()):
+            for file_id, statement in processed.items():
+                with statement.timings.span("export"):
+                    exports[file_id] = cached_export(statement.result_key, format_name, statement.stats['bank'], statement.accounts)
+
+        if prepared_now:
+            # The first build completes each usage record with its export's
+            # size and its export and database timings
+            for file_id, statement in processed.items():
+                if statement.usage_id is not None:
+                    statement.stats['timings'] = statement.timings.as_dict()
+                    statement.stats['export_format'] = format_name
+                    statement.stats['export_bytes'] = len(exports[file_id])
+                    usage_tracker.update_stats(statement.usage_id, statement.stats)
+
+        if len(processed) > 1:
+            statements = list(processed.values())
+            st.download_button(
+                label=f"Download all {export_format.label} files (zip)",
+                data=cached_zip(
+                    tuple(statement.result_key for statement in statements),
+                    tuple(statement.file_name for statement in statements),
+                    format_name,
+                    statements
+                ),
+                file_name="statements.zip",
+                mime="application/zip"
+            )
+
+        for file_id, statement in processed.items():
+            st.subheader(f"{statement.file_name} - {len(statement.accounts)} account(s)")
 
             st.download_button(
-                label=f"Download Excel file - Account {account_index}",
-                data=excel_buffer,
-                file_name=f"{file_name}_{account_index}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
\ No newline at end of file
+                label=f"Download {export_format.label} file",
+                data=exports[file_id],
+                file_name=export_name(statement.file_name, format_name),
+                mime=export_format.mime,
+                key=f"download_{file_id}"
+            )